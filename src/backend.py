@@ -0,0 +1,11 @@
+from const import *
+from number_board import NumberBoard
+from bit_board import BitBoard
+from mailbox_board import MailboxBoard
+
+BACKENDS = {"number": NumberBoard, "bitboard": BitBoard, "mailbox": MailboxBoard}
+
+
+def new_board(board=None, backend=None):
+    # builds a position of the chosen backend (const.BACKEND by default) from a Board
+    return BACKENDS[backend or BACKEND](board)
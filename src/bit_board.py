@@ -0,0 +1,372 @@
+from const import *
+from number_board import (
+    NumberBoard,
+    color,
+    RC,
+    KNIGHT_DELTAS,
+    KING_DELTAS,
+    ROOK_DIRS,
+    BISHOP_DIRS,
+    PAWN_START_ROWS,
+    PROMOTION_ROWS,
+    PROMOTION_MOVE,
+    EN_PASSANT_MOVE,
+    CASTLE_MOVE,
+)
+
+# Bitboard backend for NumberBoard.
+# Squares are numbered row * 8 + col, so bit 0 is a8 and bit 63 is h1, which
+# keeps the same (row, col) orientation as NumberBoard.squares.
+# The 8x8 squares list is still kept up to date (through put), so at(), the
+# evaluation and every other NumberBoard method keep working unchanged; only
+# move generation, the attack maps and check detection are done on the
+# bitboards.
+
+
+def _steps(s, deltas):
+    row, col = RC[s]
+    bb = 0
+    for dr, dc in deltas:
+        r, c = row + dr, col + dc
+        if 0 <= r < 8 and 0 <= c < 8:
+            bb |= 1 << (r * 8 + c)
+    return bb
+
+
+def _slide(s, occ, dirs):
+    # walks each ray until it leaves the board or hits a piece (which is included)
+    row, col = RC[s]
+    bb = 0
+    for dr, dc in dirs:
+        r, c = row + dr, col + dc
+        while 0 <= r < 8 and 0 <= c < 8:
+            b = 1 << (r * 8 + c)
+            bb |= b
+            if occ & b:
+                break
+            r += dr
+            c += dc
+    return bb
+
+
+def _relevant(s, dirs):
+    # the squares that can block a ray; the last square of a ray never blocks anything
+    row, col = RC[s]
+    bb = 0
+    for dr, dc in dirs:
+        r, c = row + dr, col + dc
+        while 0 <= r + dr < 8 and 0 <= c + dc < 8:
+            bb |= 1 << (r * 8 + c)
+            r += dr
+            c += dc
+    return bb
+
+
+KNIGHT_ATTACKS = [_steps(s, KNIGHT_DELTAS) for s in range(64)]
+KING_ATTACKS = [_steps(s, KING_DELTAS) for s in range(64)]
+# PAWN_ATTACKS[color][s] is what a pawn of that color on s attacks (index -1 is black)
+PAWN_ATTACKS = [
+    None,
+    [_steps(s, [(-1, -1), (-1, 1)]) for s in range(64)],
+    [_steps(s, [(1, -1), (1, 1)]) for s in range(64)],
+]
+
+ROOK_MASKS = [_relevant(s, ROOK_DIRS) for s in range(64)]
+BISHOP_MASKS = [_relevant(s, BISHOP_DIRS) for s in range(64)]
+
+# Slider attacks are looked up by the blockers on the relevant squares, like
+# magic bitboards but with a dict in place of the magic multiply. Entries are
+# filled in the first time a blocker pattern shows up.
+ROOK_TABLE = [{} for s in range(64)]
+BISHOP_TABLE = [{} for s in range(64)]
+
+
+def rook_attacks(s, occ):
+    occ &= ROOK_MASKS[s]
+    table = ROOK_TABLE[s]
+    att = table.get(occ)
+    if att is None:
+        att = table[occ] = _slide(s, occ, ROOK_DIRS)
+    return att
+
+
+def bishop_attacks(s, occ):
+    occ &= BISHOP_MASKS[s]
+    table = BISHOP_TABLE[s]
+    att = table.get(occ)
+    if att is None:
+        att = table[occ] = _slide(s, occ, BISHOP_DIRS)
+    return att
+
+
+def _between(s, e):
+    # the squares strictly between s and e when they share a line, else 0
+    (sr, sc), (er, ec) = RC[s], RC[e]
+    dr, dc = er - sr, ec - sc
+    if s == e or not (dr == 0 or dc == 0 or abs(dr) == abs(dc)):
+        return 0
+    dr, dc = (dr > 0) - (dr < 0), (dc > 0) - (dc < 0)
+    bb = 0
+    r, c = sr + dr, sc + dc
+    while (r, c) != (er, ec):
+        bb |= 1 << (r * 8 + c)
+        r += dr
+        c += dc
+    return bb
+
+
+BETWEEN = [[_between(s, e) for e in range(64)] for s in range(64)]
+
+FILE_A = sum(1 << (row * 8) for row in range(8))
+FILE_H = FILE_A << 7
+FULL = (1 << 64) - 1
+
+
+def lsb(bb):
+    return (bb & -bb).bit_length() - 1
+
+
+class BitBoard(NumberBoard):
+    def __init__(self, board=None):
+        self.pieces = [0] * 13  # one bitboard per piece id, indexed by piece + 6
+        self.occupied = [0, 0, 0]  # one bitboard per color, indexed by color
+        super().__init__(board)
+        self.sync_bitboards()
+
+    def sync_bitboards(self):
+        # rebuilds the bitboards from self.squares
+        self.pieces = [0] * 13
+        self.occupied = [0, 0, 0]
+        for row in range(ROWS):
+            for col in range(COLS):
+                p = self.squares[row][col]
+                if p:
+                    b = 1 << (row * 8 + col)
+                    self.pieces[p + 6] |= b
+                    self.occupied[color(p)] |= b
+
+    def _copy_pieces(self, nb):
+        super()._copy_pieces(nb)
+        nb.pieces = self.pieces[:]
+        nb.occupied = self.occupied[:]
+
+    def put(self, square, piece):
+        row, col = square
+        old = self.squares[row][col]
+        b = 1 << (row * 8 + col)
+        if old:
+            self.pieces[old + 6] ^= b
+            self.occupied[1 if old > 0 else -1] ^= b
+        if piece:
+            self.pieces[piece + 6] |= b
+            self.occupied[1 if piece > 0 else -1] |= b
+        self.squares[row][col] = piece
+
+    def from_string(self, string):
+        super().from_string(string)
+        self.sync_bitboards()
+
+    def attacked(self, s, by):
+        # is square s attacked by any piece of color by
+        pieces = self.pieces
+        if KNIGHT_ATTACKS[s] & pieces[2 * by + 6]:
+            return True
+        if KING_ATTACKS[s] & pieces[6 * by + 6]:
+            return True
+        if PAWN_ATTACKS[-by][s] & pieces[by + 6]:
+            return True
+        occ = self.occupied[1] | self.occupied[-1]
+        queens = pieces[5 * by + 6]
+        if rook_attacks(s, occ) & (pieces[4 * by + 6] | queens):
+            return True
+        return bishop_attacks(s, occ) & (pieces[3 * by + 6] | queens) != 0
+
+    def attacked_map(self, by, ignore=None):
+        # NumberBoard.attacked_map as one bitboard, bit s set when a piece of
+        # color by attacks s; sliders see through the square ignore
+        pieces = self.pieces
+        occ = self.occupied[1] | self.occupied[-1]
+        if ignore is not None:
+            occ &= ~(1 << ignore)
+        pawns = pieces[by + 6]
+        if by == 1:
+            attacked = (pawns & ~FILE_A) >> 9 | (pawns & ~FILE_H) >> 7
+        else:
+            attacked = ((pawns & ~FILE_A) << 7 | (pawns & ~FILE_H) << 9) & FULL
+        for kind, attacks in ((2, None), (3, bishop_attacks), (4, rook_attacks), (5, None), (6, None)):
+            bb = pieces[kind * by + 6]
+            while bb:
+                low = bb & -bb
+                s = low.bit_length() - 1
+                if kind == 2:
+                    attacked |= KNIGHT_ATTACKS[s]
+                elif kind == 6:
+                    attacked |= KING_ATTACKS[s]
+                elif kind == 5:
+                    attacked |= rook_attacks(s, occ) | bishop_attacks(s, occ)
+                else:
+                    attacked |= attacks(s, occ)
+                bb ^= low
+        return attacked
+
+    def attack_info(self, pcolor):
+        # NumberBoard.attack_info with attacked, evasions and each pin as a
+        # bitboard, for _legal_codes below
+        king = self.kings[pcolor]
+        ks = None if king is None else king[0] * 8 + king[1]
+        attacked = self.attacked_map(-pcolor, ks)
+        pins = {}
+        if king is None:
+            return king, attacked, 0, 0, pins
+        pieces = self.pieces
+        enemy = -pcolor
+        own = self.occupied[pcolor]
+        occ = own | self.occupied[enemy]
+        evasions = PAWN_ATTACKS[pcolor][ks] & pieces[enemy + 6] | KNIGHT_ATTACKS[ks] & pieces[2 * enemy + 6]
+        checkers = bin(evasions).count("1")
+        queens = pieces[5 * enemy + 6]
+        for attacks, sliders in (
+            (rook_attacks, pieces[4 * enemy + 6] | queens),
+            (bishop_attacks, pieces[3 * enemy + 6] | queens),
+        ):
+            seen = attacks(ks, occ)
+            checks = seen & sliders
+            while checks:
+                low = checks & -checks
+                checkers += 1
+                evasions |= BETWEEN[ks][low.bit_length() - 1] | low
+                checks ^= low
+            # take away our first piece on each ray: a slider seen behind it pins it
+            pinners = attacks(ks, occ ^ (seen & own)) & sliders & ~seen
+            while pinners:
+                low = pinners & -pinners
+                ray = BETWEEN[ks][low.bit_length() - 1]
+                pins[(ray & own).bit_length() - 1] = ray | low
+                pinners ^= low
+        return king, attacked, checkers, evasions, pins
+
+    def _legal_codes(self, s, codes, info, out):
+        # NumberBoard._legal_codes, testing bits of the attack_info bitboards
+        king, attacked, checkers, evasions, pins = info
+        if abs(self.squares[s >> 3][s & 7]) == 6:
+            for code in codes:
+                e = code >> 6 & 63
+                if attacked >> e & 1:
+                    continue
+                # no castling out of or through check
+                if code >> 14 == CASTLE_MOVE and (checkers or attacked >> ((s + e) >> 1) & 1):
+                    continue
+                out.append(code)
+            return
+        if checkers > 1:
+            return  # double check, only the king can move
+        pin = pins.get(s)
+        for code in codes:
+            e = code >> 6 & 63
+            if pin is not None and not pin >> e & 1:
+                continue
+            if code >> 14 == EN_PASSANT_MOVE:
+                if self._en_passant_legal(code, king, checkers, evasions):
+                    out.append(code)
+                continue
+            if checkers and not evasions >> e & 1:
+                continue
+            out.append(code)
+
+    def _en_passant_legal(self, code, king, checkers, evasions):
+        # the check test on the evasions bitboard, the rest as NumberBoard
+        taken = (code & 63) & ~7 | (code >> 6 & 7)  # on the pawn's row, in the end column
+        if checkers and not (evasions >> taken | evasions >> (code >> 6 & 63)) & 1:
+            return False
+        return super()._en_passant_legal(code, king, 0, evasions)
+
+    def is_square_attacked(self, square, by):
+        row, col = square
+        return self.attacked(row * 8 + col, by)
+
+    def king_square(self, pcolor):
+        kings = self.pieces[6 * pcolor + 6]
+        return lsb(kings) if kings else None
+
+    def in_check(self, color):
+        s = self.king_square(color)
+        return s is not None and self.attacked(s, -color)
+
+    def _pseudo_codes(self, s, pcolor, buf, captures=False):
+        # appends the pseudo legal moves of the piece on s to buf as move codes,
+        # only captures and promotions if captures is set
+        kind = self.squares[s >> 3][s & 7] * pcolor
+        own = self.occupied[pcolor]
+        enemy = self.occupied[-pcolor]
+        occ = own | enemy
+
+        if kind == 1:
+            row = s >> 3
+            targets = 0
+            promotion = row - pcolor == PROMOTION_ROWS[pcolor]
+            one = s - 8 * pcolor
+            if not occ >> one & 1 and (promotion or not captures):
+                targets |= 1 << one
+                two = one - 8 * pcolor
+                if row == PAWN_START_ROWS[pcolor] and not occ >> two & 1:
+                    targets |= 1 << two
+            targets |= PAWN_ATTACKS[pcolor][s] & enemy
+            if self.en_passant:
+                er, ec = self.en_passant
+                if PAWN_ATTACKS[pcolor][s] >> (er * 8 + ec) & 1:
+                    buf.append(s | (er * 8 + ec) << 6 | EN_PASSANT_MOVE << 14)
+            while targets:
+                low = targets & -targets
+                code = s | (low.bit_length() - 1) << 6
+                if promotion:
+                    for bits in range(4):  # knight, bishop, rook, queen
+                        buf.append(code | bits << 12 | PROMOTION_MOVE << 14)
+                else:
+                    buf.append(code)
+                targets ^= low
+            return
+
+        if kind == 2:
+            targets = KNIGHT_ATTACKS[s]
+        elif kind == 3:
+            targets = bishop_attacks(s, occ)
+        elif kind == 4:
+            targets = rook_attacks(s, occ)
+        elif kind == 5:
+            targets = rook_attacks(s, occ) | bishop_attacks(s, occ)
+        else:
+            targets = KING_ATTACKS[s]
+            if not captures:
+                self._castle_codes(s, pcolor, buf)
+        targets &= enemy if captures else ~own
+        while targets:
+            low = targets & -targets
+            buf.append(s | (low.bit_length() - 1) << 6)
+            targets ^= low
+
+    def _castle_codes(self, s, pcolor, buf):
+        # the rights, the rook and the empty squares in between; the legality
+        # test checks the king isn't in or passing through check
+        left, right = self.castleable[pcolor]
+        if not (left or right) or s & 7 != 4:
+            return
+        rooks = self.pieces[4 * pcolor + 6]
+        occ = self.occupied[1] | self.occupied[-1]
+        if left and rooks >> (s - 4) & 1 and not occ & (7 << (s - 3)):
+            buf.append(s | (s - 2) << 6 | CASTLE_MOVE << 14)
+        if right and rooks >> (s + 3) & 1 and not occ & (3 << (s + 1)):
+            buf.append(s | (s + 2) << 6 | CASTLE_MOVE << 14)
+
+    def generate(self, pcolor, buf, captures=False):
+        # NumberBoard.generate, only visiting the squares pcolor has pieces on
+        info = self.attack_info(pcolor)
+        scratch = self._scratch
+        bb = self.occupied[pcolor]
+        while bb:
+            low = bb & -bb
+            s = low.bit_length() - 1
+            del scratch[:]
+            self._pseudo_codes(s, pcolor, scratch, captures)
+            self._legal_codes(s, scratch, info, buf)
+            bb ^= low
+        return buf
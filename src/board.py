@@ -1,4 +1,3 @@
-import copy
 import os
 
 from math import ceil
@@ -8,7 +7,9 @@ from square import Square
 from piece import *
 from move import Move
 from sound import Sound
-from number_board import NumberBoard
+from number_board import Move as NumberMove
+from backend import new_board
+from move_cache import MOVE_CACHE
 from time import time
 
 # This class (the Board class) sets up the board as a 2D array of Square objects, some of them have pieces.
@@ -28,8 +29,10 @@ class Board:
         self.counter = 0  # Used for FEN and for counting the total number of turns played on the board.
         self.moves = []
         self.played_moves = []
-        self.positions = []  # Used to store positions to check for repetition
-        self.positions.append(self.position_to_FEN().split(" ")[0])
+        # The same position as a NumberBoard (or bitboard, see const.BACKEND),
+        # built once and kept in step by move and take_back; every move query
+        # is answered from it, through the shared legal-move cache
+        self.nb = new_board(self)
 
     def move(self, piece, move, sidebar=None, testing=False, castling=False):
         initial = move.initial
@@ -86,9 +89,6 @@ class Board:
                 )
                 self.move(rook, rook_move, castling=True)
                 castling_sound.play()
-        if move.pawn_move_or_capture():
-            self.positions.clear()
-        self.positions.append(self.position_to_FEN().split()[0])
 
         # move
         piece.moved = True
@@ -99,6 +99,19 @@ class Board:
         # set last move
         self.last_move = (move, piece)
 
+        if not (testing or castling):
+            self.nb.move(
+                NumberMove((initial.row, initial.col), (final.row, final.col), self.promoted_to(piece, final))
+            )
+
+    def promoted_to(self, piece, final):
+        # the piece id (2 to 5) a pawn that just moved to final was promoted to, or None
+        if isinstance(piece, Pawn) and final.row in (0, 7):
+            promoted = self.squares[final.row][final.col].piece
+            if promoted is not None and promoted is not piece:
+                return abs(promoted.piece_id)
+        return None
+
     def valid_move(self, piece, move):
         return move in piece.moves
 
@@ -157,26 +170,32 @@ class Board:
             # put captured piece on final square
             self.squares[final.row][final.col].piece = captured_piece
 
+            # what the Square moves above don't undo, read from the
+            # NumberBoard's record of the move, which is then taken back too
+            lm = self.nb.move_list[-1]
+            if lm.rook_start:
+                rook = self.at(lm.rook_end).piece
+                self.at(lm.rook_end).piece = None
+                self.at(lm.rook_start).piece = rook
+                rook.moved = False
+            if lm.taken_at != lm.end:
+                # en passant, the taken pawn stood next to final
+                self.at(lm.taken_at).piece = Pawn("white" if lm.taking > 0 else "black")
+            self.en_passant = lm.old_en_passant
+            self.nb.take_back()
+            self.last_move = (self.moves[-1][1], self.moves[-1][0]) if self.moves else None
+
     def castling(self, initial, final):
         return abs(initial.col - final.col) == 2
 
-    def in_check(
-        self, piece, move
-    ):  # Used to determine whether a move will result in the king being taken, and if so, that move is not appended.
-        temp_piece = copy.deepcopy(piece)
-        temp_board = copy.deepcopy(self)
-        temp_board.move(temp_piece, move, testing=True)
-
-        for row in range(ROWS):
-            for col in range(COLS):
-                if temp_board.squares[row][col].has_rival_piece(piece.color):
-                    p = temp_board.squares[row][col].piece
-                    temp_board.calc_moves(p, row, col)
-                    # bool is there to prevent infinite looping between in_check() and calc_moves(), as both methods are called within each other.
-                    for m in p.moves:
-                        if isinstance(m.final.piece, King):
-                            return True
-        return False
+    def in_check(self, piece, move):
+        # Whether playing move would leave piece's own king in check. The move
+        # is made and taken back on the NumberBoard mirror (no copy of the
+        # Board, which isn't touched); a promotion is tried as a queen, what
+        # the pawn becomes can't change whether its own king is attacked
+        promotion = 5 if isinstance(piece, Pawn) and move.final.row in (0, 7) else None
+        m = NumberMove((move.initial.row, move.initial.col), (move.final.row, move.final.col), promotion)
+        return self.nb.move_in_check(m, 1 if piece.color == "white" else -1)
 
     def check_in_between_move_squares(
         self, piece, move
@@ -241,29 +260,25 @@ class Board:
     def check_in_check(
         self, color
     ):  # Checks if a color (white or black) is currently in check, RIGHT NOW, ON THE ORIGINAL GAME BOARD
-        opponent_color = "black" if color == "white" else "white"
-        pieces = []
-        for row in range(ROWS):
-            for col in range(COLS):
-                if self.squares[row][col].has_piece():
-                    piece = self.squares[row][col].piece
-                    if piece.color == opponent_color:
-                        pieces.append(piece)
-        for piece in pieces:
-            for m in piece.moves:
-                if m.final.has_rival_piece(opponent_color):
-                    if isinstance(m.final.piece, King):
-                        return True
-        return False
+        return self.legal_moves(color).in_check
 
     def at(self, loc):
         row, col = loc
         return self.squares[row][col]
 
+    def legal_moves(self, color):
+        # The move_cache.LegalMoves of color ("white" or "black") in the
+        # current position: all of its moves, generated in one pass the first
+        # time any of them is asked for, and whether it's in check or mated
+        return MOVE_CACHE.get(self.nb, 1 if color == "white" else -1)
+
+    def status(self, color):
+        # "checkmate", "stalemate", "check" or None for color right now
+        return self.legal_moves(color).status()
+
     def calc_moves(self, piece, row, col):
-        loc = (row, col)  # location
-        nb = NumberBoard(self)  # Creation of number board
-        ms = nb.calc_moves(loc)  # generated moves list.
+        nb = self.nb
+        ms = self.legal_moves(piece.color).by_square.get((row, col), [])
 
         def cnmbm(m):  # convert number board to board move
             sq = self.at(m.start)
@@ -271,11 +286,12 @@ class Board:
             return Move(sq, eq)
 
         Ms = [cnmbm(m) for m in ms]
-        for M in Ms:
+        for m, M in zip(ms, Ms):
             if M.final.has_piece():
                 M.set_capture(True)
             if isinstance(M.initial.piece, Pawn):
                 M.set_pawn_move(True)
+            M.set_safe(nb.see(nb.move_code(m)) >= 0)
         piece.moves = Ms
 
     def testcm(self):
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# Board representation benchmark: compares the backends on move generation,
+# make/unmake, copy() and at/put over the perft positions. Run from src/, e.g.
+#   python board_bench.py
+#   python board_bench.py --backend number --backend mailbox --json boards.json
+import argparse
+import json
+import platform
+from array import array
+from time import time
+
+from backend import BACKENDS, new_board
+from perft import POSITIONS
+
+
+def rate(fun, boards, repeat):
+    # calls per second of fun over every board
+    start = time()
+    for _ in range(repeat):
+        for nb in boards:
+            fun(nb)
+    elapsed = time() - start
+    return repeat * len(boards) / elapsed if elapsed > 0 else None
+
+
+def make_unmake(nb):
+    for move in nb.generate(nb.side_to_move(), array("H")):
+        nb.make(move)
+        nb.take_back()
+
+
+def at_put(nb):
+    for row in range(8):
+        for col in range(8):
+            nb.put((row, col), nb.at((row, col)))
+
+
+def bench(backend, repeat, depth):
+    boards = [new_board(backend=backend).from_fen(fen) for name, fen, counts in POSITIONS]
+    result = {
+        "backend": backend,
+        "generate": rate(lambda nb: nb.generate(nb.side_to_move(), array("H")), boards, repeat),
+        "make_unmake": rate(make_unmake, boards, repeat),
+        "copy": rate(lambda nb: nb.copy(), boards, repeat * 10),
+        "at_put": rate(at_put, boards, repeat),
+    }
+    start = time()
+    nodes = sum(nb.perft(depth) for nb in boards)
+    elapsed = time() - start
+    result["perft_nps"] = nodes / elapsed if elapsed > 0 else None
+    return {k: round(v) if isinstance(v, float) else v for k, v in result.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Board representation benchmark")
+    parser.add_argument("--backend", action="append", choices=sorted(BACKENDS), help="backends to compare (default all)")
+    parser.add_argument("--repeat", type=int, default=200, help="times each position is timed")
+    parser.add_argument("--depth", type=int, default=3, help="perft depth for the nodes/sec column")
+    parser.add_argument("--json", metavar="PATH", help="write the results as JSON")
+    args = parser.parse_args()
+
+    results = [bench(backend, args.repeat, args.depth) for backend in args.backend or sorted(BACKENDS)]
+    columns = ["generate", "make_unmake", "copy", "at_put", "perft_nps"]
+    print("{:<10}".format("per sec") + "".join("{:>13}".format(c) for c in columns))
+    for r in results:
+        print("{:<10}".format(r["backend"]) + "".join("{:>13}".format(r[c]) for c in columns))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {"python": platform.python_version(), "time": time(), "results": results},
+                f,
+                indent=2,
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# GUI board check: plays random games (with take-backs) on the pygame Board
+# and checks after every step that its NumberBoard mirror, the cached legal
+# moves and Board.in_check agree with a NumberBoard built fresh from the
+# Board. Needs pygame (the Board plays its sounds, on a dummy audio driver);
+# run from the repository root, where assets/ is, e.g.
+#   python src/board_check.py
+#   python src/board_check.py --games 50
+import argparse
+import contextlib
+import io
+import os
+import random
+from array import array
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+import pygame
+
+from backend import new_board
+from board import Board
+from move import Move
+from number_board import decode_move, Move as NumberMove
+from square import Square
+
+
+class RandomPromotion:
+    # stands in for the sidebar, which asks the player what to promote to
+    def __init__(self, rng):
+        self.rng = rng
+
+    def get_promotion(self, choices):
+        return self.rng.choice(choices)
+
+
+def compare(board, color):
+    # the differences between board's mirror and a fresh NumberBoard, as text
+    nb = board.nb
+    fresh = new_board(board)
+    errors = []
+    if [list(row) for row in nb.squares] != [list(row) for row in fresh.squares]:
+        errors.append("squares")
+    if (nb.castling_index(), nb.en_passant, nb.zobrist) != (fresh.castling_index(), fresh.en_passant, fresh.zobrist):
+        errors.append("castling, en passant or key")
+    pcolor = 1 if color == "white" else -1
+    cached = sorted(str(m) for moves in board.legal_moves(color).by_square.values() for m in moves)
+    if cached != sorted(str(m) for m in fresh.calc_color_moves(pcolor)):
+        errors.append("cached legal moves")
+    # every pseudo legal move: does Board.in_check (on the mirror) say the
+    # same as playing it on the fresh board?
+    buf = array("H")
+    for s in range(64):
+        if fresh.squares[s >> 3][s & 7] * pcolor > 0:
+            fresh._pseudo_codes(s, pcolor, buf)
+    for code in buf:
+        m = decode_move(code)
+        piece = board.squares[m.start[0]][m.start[1]].piece
+        move = Move(Square(*m.start), Square(*m.end))
+        fresh.move(NumberMove(m.start, m.end, m.promotion))
+        expected = fresh.in_check(pcolor)
+        fresh.take_back()
+        if board.in_check(piece, move) != expected:
+            errors.append("in_check {}".format(m))
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GUI board and NumberBoard mirror check")
+    parser.add_argument("--games", type=int, default=30)
+    parser.add_argument("--plies", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    pygame.mixer.init()
+
+    rng = random.Random(args.seed)
+    sidebar = RandomPromotion(rng)
+    steps = 0
+    failures = 0
+    for game in range(args.games):
+        board = Board()
+        color = "white"
+        played = 0
+        for ply in range(args.plies):
+            if played and rng.random() < 0.15:
+                board.take_back()
+                played -= 1
+            else:
+                moves = board.calc_color_moves(color)
+                if not moves:
+                    break
+                piece, m = rng.choice(moves)
+                move = Move(Square(m.initial.row, m.initial.col), Square(m.final.row, m.final.col))
+                with contextlib.redirect_stdout(io.StringIO()):  # Board.move prints its notation work
+                    board.move(piece, move, sidebar)
+                played += 1
+            color = "black" if color == "white" else "white"
+            steps += 1
+            errors = compare(board, color)
+            if errors:
+                failures += 1
+                if failures <= 10:
+                    print("game {} ply {}: {}".format(game, ply, ", ".join(errors)))
+    print("{} steps, {} failures".format(steps, failures))
+    return 0 if failures == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -8,3 +8,47 @@ BOARD_HEIGHT = HEIGHT
 ROWS = 8
 COLS = 8
 SQSIZE = (BOARD_WIDTH) // COLS
+
+# Outline around a highlighted move's square when the piece would be lost there
+UNSAFE_MOVE_OUTLINE = (60, 60, 60)
+
+# Position backend used for move generation and search: "number" (NumberBoard),
+# "bitboard" (BitBoard) or "mailbox" (MailboxBoard). NumberBoard is the default.
+# "mailbox" is experimental: only its copy() beats NumberBoard in board_bench,
+# and search_bench is no faster with it, so it is kept for comparison only
+BACKEND = "number"
+
+# Memory budget of the search's transposition table, in MB
+TT_SIZE_MB = 16
+
+# Positions the legal-move cache shared by the GUI and the bot keeps
+MOVE_CACHE_SIZE = 256
+
+# Time the bot may think for each move, in seconds, and the deepest it will go
+BOT_MOVETIME = 2.0
+BOT_MAX_DEPTH = 64
+
+# Processes the bot searches with, 1 searches in this process
+BOT_WORKERS = 1
+
+# Check the incrementally kept evaluation against a full recompute on every read (slow, for debugging)
+DEBUG_EVAL = False
+
+# Print the bot's search info for every depth, its time and the table stats after each move
+DEBUG_SEARCH = False
+
+# Search features, on by default; the benchmarks turn them off to measure what they save.
+# Killer moves and the history table for ordering quiet moves
+SEARCH_HISTORY = True
+# Null move pruning: give the opponent a free move, if we're still above beta
+# the real moves will be too (skipped in check and for a side with only pawns)
+SEARCH_NULL_MOVE = True
+# Late move reductions: quiet moves ordered late are searched less deep first
+SEARCH_LMR = True
+# Principal variation search: moves after the first get a null window
+SEARCH_PVS = True
+# Aspiration windows: each depth of iterative deepening starts in a narrow
+# window around the score of the depth before
+SEARCH_ASPIRATION = True
+# Static exchange pruning: the quiescence search skips captures that lose material
+SEARCH_SEE = True
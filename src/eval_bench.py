@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# Evaluation benchmark: checks that the incrementally kept scores behind
+# NumberBoard.evaluate_board match a full recompute on a corpus of positions,
+# that the tapered evaluation prefers what it should (PREFERENCES), and
+# compares how many evaluations per second each way manages. Run from src/, e.g.
+#   python eval_bench.py
+#   python eval_bench.py --games 50 --json eval.json
+import argparse
+import json
+import random
+from time import time
+
+from backend import new_board
+from number_board import PHASE_MATERIAL
+from perft import POSITIONS
+
+
+def recompute(nb):
+    # evaluate_board from scratch, without the incrementally kept scores
+    material = nb.compute_material()
+    non_pawn = nb.compute_non_pawn()
+    middlegame, endgame = nb.compute_piece_squares()
+    phase = min(non_pawn[1] + non_pawn[-1], PHASE_MATERIAL)
+    bonus = (middlegame * phase + endgame * (PHASE_MATERIAL - phase)) // PHASE_MATERIAL
+    return (material + bonus) / 10
+
+
+# (FEN, FEN) pairs the tapered evaluation must score the first higher (for
+# white) than the second
+PREFERENCES = [
+    # king and pawns: the king belongs in the centre
+    ("8/5pk1/6p1/8/4K3/6P1/5P2/8 w - - 0 40", "8/5pk1/6p1/8/8/6P1/5P2/7K w - - 0 40"),
+    # but behind its pawns with the queens on
+    (
+        "r1bq1rk1/pppp1ppp/2n2n2/2b1p3/2B1P3/2NP1N2/PPP2PPP/R1BQ1RK1 w - - 0 7",
+        "r1bq1rk1/pppp1ppp/2n2n2/2b1p3/2B1P3/2NPKN2/PPP2PPP/R1BQ3R w - - 0 7",
+    ),
+    # a passed pawn is worth more the further it has got in an ending
+    ("8/4k3/1P6/8/8/8/8/4K3 w - - 0 50", "8/4k3/8/8/8/1P6/8/4K3 w - - 0 50"),
+]
+
+
+def corpus(games=20, plies=80, seed=1):
+    # the perft positions plus the positions of some random games from them
+    # (played on the bitboard backend, it's quicker)
+    rng = random.Random(seed)
+    boards = []
+    for name, fen, counts in POSITIONS:
+        nb = new_board(backend="bitboard").from_fen(fen)
+        boards.append(nb.copy())
+    starts = [b.copy() for b in boards]
+    for game in range(games):
+        nb = starts[game % len(starts)].copy()
+        for ply in range(plies):
+            moves = nb.calc_color_moves(nb.side_to_move())
+            if not moves:
+                break
+            nb.move(rng.choice(moves))
+            boards.append(nb.copy())
+    return boards
+
+
+def rate(fun, boards, repeat):
+    start = time()
+    for _ in range(repeat):
+        for nb in boards:
+            fun(nb)
+    elapsed = time() - start
+    return repeat * len(boards) / elapsed if elapsed > 0 else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluation correctness and speed check")
+    parser.add_argument("--games", type=int, default=20, help="random games added to the corpus")
+    parser.add_argument("--repeat", type=int, default=20, help="times each position is evaluated for timing")
+    parser.add_argument("--json", metavar="PATH", help="write the results as JSON")
+    args = parser.parse_args()
+
+    boards = corpus(args.games)
+    mismatches = [
+        nb for nb in boards
+        if nb.evaluate_board() != recompute(nb)
+        or nb.material != nb.compute_material()
+        or nb.non_pawn != nb.compute_non_pawn()
+        or (nb.middlegame, nb.endgame) != nb.compute_piece_squares()
+    ]
+    wrong = []
+    for better, worse in PREFERENCES:
+        a = new_board().from_fen(better).evaluate_board()
+        b = new_board().from_fen(worse).evaluate_board()
+        if a <= b:
+            wrong.append((better, worse))
+            print("prefers {} ({}) over {} ({})".format(worse, b, better, a))
+    before = rate(recompute, boards, args.repeat)
+    after = rate(lambda nb: nb.evaluate_board(), boards, args.repeat)
+    print("{} positions, {} mismatches, {} wrong preferences".format(len(boards), len(mismatches), len(wrong)))
+    print("recompute   {:>10.0f} evals/sec".format(before))
+    print("incremental {:>10.0f} evals/sec ({:.1f}x)".format(after, after / before))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "positions": len(boards),
+                    "mismatches": len(mismatches),
+                    "wrong_preferences": len(wrong),
+                    "recompute": round(before),
+                    "incremental": round(after),
+                    "time": time(),
+                },
+                f,
+                indent=2,
+            )
+    return 1 if mismatches or wrong else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -5,7 +5,6 @@ from const import *
 from dragger import Dragger
 from config import Config
 from square import Square
-from number_board import NumberBoard
 
 
 class Game:
@@ -91,6 +90,9 @@ class Game:
                 )
                 # blit
                 pygame.draw.rect(surface, color, rect)
+                if not move.is_it_safe():
+                    # the piece would be lost there, outline the square
+                    pygame.draw.rect(surface, UNSAFE_MOVE_OUTLINE, rect, 4)
 
     def show_last_move(self, surface):
         theme = self.config.theme
@@ -154,75 +156,26 @@ class Game:
             pygame.display.set_caption(self.winner + " has won the game.")
 
     def check_game_over(self):
-        # Necessary Lists that are traversed to check for checks, and then for stalemate or checkmate, whichever occurs on the board
-        total_black_moves = 0
-        total_white_moves = 0
-
-        # Shorthanding self.board to board
+        # Checkmate and stalemate from the side to move's legal moves, through
+        # the move cache the GUI and the bot share, so they are generated once
+        # a turn; the draw rules are kept up to date move by move on the
+        # NumberBoard mirror, so nothing here walks the board or the moves
         board = self.board
-
-        # Traversing through the board, calculating the moves of every piece alive, maybe this can be reduced in length to reduce lag???
-        for row in range(ROWS):
-            for col in range(COLS):
-                # Fills up the initialized lists with all the information it is supposed to contain.
-                if board.squares[row][col].has_piece():
-                    piece = board.squares[row][col].piece
-                    board.calc_moves(
-                        piece, row, col
-                    )  # Without a shadow of a doubt, this is the line that causes the lag...if there is any
-                    moves = piece.moves
-                    if piece.color == "black":
-                        total_black_moves += len(moves)
-                    else:
-                        total_white_moves += len(moves)
-
-        # Use of lists to determine checkmate or stalemate if one side has no moves..
-        if total_black_moves == 0:
-            if board.check_in_check("black"):
-                self.display_winner("White")
-            else:
-                self.display_stalemate()
-            self.over = True
-
-        elif total_white_moves == 0:
-            if board.check_in_check("white"):
-                self.display_winner("Black")
-            else:
-                self.display_stalemate()
-            self.over = True
-
-        # Implementation of draw by 50 move rule (if no piece is taken or if no pawn is pushed for 50 moves (100 total turns), it is a draw)
-        if (
-            board.counter >= 100
-        ):  # 50 move rule is physically impossible if less than 50 moves have been played by each side, and the counter increments for every white and black move.
-            for i in range(board.counter - 100, board.counter):
-                if board.moves[i][
-                    1
-                ].pawn_move_or_capture():  # breaking if any of the last 50 moves are pawn moves or captures
-                    break
-                if i == board.counter - 1:
-                    self.display_draw_by_fifty_move_rule()  # if ALL of the last 50 moves are NOT pawn moves or captures, the game ends in a draw by 50 move rule.
-                    self.over = True
-
-        # Implementation of draw by repetition (This one will be very hard guys)
-        print(self.board.positions)
-        if self.drawn_by_repetition(board):
-            print("Drawn by repetition")
-            self.over = True
-        # Implementation of draw by insufficient material: This one will also be pretty hard :(
-        nb = NumberBoard(board)
-        if nb.draw_by_insufficient_material():
-            self.over = True
-
-    def drawn_by_repetition(self, board):
-        for pos in board.positions:
-            counter = 0
-            for other_pos in board.positions:
-                if other_pos == pos:
-                    counter += 1
-            if counter >= 3:
-                return True
-        return False
+        color = "white" if board.nb.side_to_move() == 1 else "black"
+        status = board.status(color)
+        if status == "checkmate":
+            self.display_winner("Black" if color == "white" else "White")
+        elif status == "stalemate":
+            self.display_stalemate()
+        else:
+            status = board.nb.draw_status()
+            if status is None:
+                return
+            if status == "fifty moves":
+                self.display_draw_by_fifty_move_rule()
+            elif status == "repetition":
+                print("Drawn by repetition")
+        self.over = True
 
     def display_winner(self, color):
         self.winner = color
@@ -0,0 +1,228 @@
+from array import array
+
+from const import *
+from number_board import NumberBoard, PROMOTION_ROWS, PAWN_START_ROWS, PROMOTION_MOVE, EN_PASSANT_MOVE
+
+# 10x12 mailbox backend for NumberBoard.
+# The pieces live in one flat signed byte array of 120 entries: the 8x8 board
+# padded with a two square border of OFF above and below and one on each
+# side, so a knight jump or a slider step off the board lands on OFF and is
+# stopped by the same lookup that reads the target square, no bounds checks.
+# That array is the only piece state: at/put index it directly and copy() is
+# a single buffer copy. The NumberBoard methods that read squares[row][col]
+# get 8 memoryview rows into the same array, made the first time one of them
+# asks (see squares below), so a copy doesn't pay for them.
+# Experimental, see const.BACKEND: only copy() beats NumberBoard in the benchmarks.
+
+OFF = 7  # not a piece id
+
+MAILBOX = [21 + (s // 8) * 10 + s % 8 for s in range(64)]  # square index -> mailbox index
+SQUARE = [-1] * 120  # mailbox index -> square index
+for _s, _m in enumerate(MAILBOX):
+    SQUARE[_m] = _s
+
+KNIGHT_OFFSETS = [-21, -19, -12, -8, 8, 12, 19, 21]
+KING_OFFSETS = [-11, -10, -9, -1, 1, 9, 10, 11]
+ROOK_OFFSETS = [-10, 10, -1, 1]
+BISHOP_OFFSETS = [-11, -9, 9, 11]
+SLIDER_OFFSETS = [None, None, None, BISHOP_OFFSETS, ROOK_OFFSETS, ROOK_OFFSETS + BISHOP_OFFSETS]
+# where a pawn of each color captures towards (index -1 is black)
+PAWN_CAPTURE_OFFSETS = [None, [-11, -9], [9, 11]]
+
+
+def empty_mailbox():
+    board = array("b", [OFF] * 120)
+    for m in MAILBOX:
+        board[m] = 0
+    return board
+
+
+class MailboxBoard(NumberBoard):
+    @property
+    def squares(self):
+        # squares[row] is a view of the 8 real squares of that row in mailbox
+        rows = self._rows
+        if rows is None:
+            view = memoryview(self.mailbox)
+            rows = self._rows = [view[21 + row * 10 : 29 + row * 10] for row in range(ROWS)]
+        return rows
+
+    @squares.setter
+    def squares(self, rows):
+        # NumberBoard.__init__ sets the pieces up as 8 lists, they are copied in
+        mailbox = empty_mailbox()
+        for s, m in enumerate(MAILBOX):
+            mailbox[m] = rows[s >> 3][s & 7]
+        self.set_mailbox(mailbox)
+
+    def set_mailbox(self, mailbox):
+        self.mailbox = mailbox
+        self._rows = None  # views of the old array
+
+    def _copy_pieces(self, nb):
+        nb.set_mailbox(self.mailbox[:])  # one buffer copy
+
+    def __getstate__(self):
+        # memoryviews can't be pickled (the parallel search sends boards to
+        # its workers), they are made again from the array when needed
+        state = self.__dict__.copy()
+        state["_rows"] = None
+        return state
+
+    def at(self, square):
+        row, col = square
+        return self.mailbox[21 + row * 10 + col]
+
+    def put(self, square, piece):
+        row, col = square
+        self.mailbox[21 + row * 10 + col] = piece
+
+    def _pseudo_codes(self, s, pcolor, buf, captures=False):
+        # NumberBoard._pseudo_codes, walking the mailbox
+        board = self.mailbox
+        m = MAILBOX[s]
+        kind = board[m] * pcolor
+
+        if kind == 1:
+            row = s >> 3
+            one = m - 10 * pcolor
+            if board[one] == OFF:
+                return
+            promotion = row - pcolor == PROMOTION_ROWS[pcolor]
+            ends = []
+            if board[one] == 0 and (promotion or not captures):
+                ends.append(one)
+                if row == PAWN_START_ROWS[pcolor] and board[one - 10 * pcolor] == 0:
+                    ends.append(one - 10 * pcolor)
+            for offset in PAWN_CAPTURE_OFFSETS[pcolor]:
+                t = m + offset
+                p = board[t]
+                if p == OFF:
+                    continue
+                if p * pcolor < 0:
+                    ends.append(t)
+                elif self.en_passant is not None and SQUARE[t] == self.en_passant[0] * 8 + self.en_passant[1]:
+                    buf.append(s | SQUARE[t] << 6 | EN_PASSANT_MOVE << 14)
+            for t in ends:
+                if promotion:
+                    for bits in range(4):  # knight, bishop, rook, queen
+                        buf.append(s | SQUARE[t] << 6 | bits << 12 | PROMOTION_MOVE << 14)
+                else:
+                    buf.append(s | SQUARE[t] << 6)
+            return
+
+        if kind == 2 or kind == 6:
+            for offset in KNIGHT_OFFSETS if kind == 2 else KING_OFFSETS:
+                p = board[m + offset]
+                if p != OFF and (p * pcolor < 0 or (p == 0 and not captures)):
+                    buf.append(s | SQUARE[m + offset] << 6)
+            if kind == 6 and not captures:
+                self._castle_codes(s, pcolor, buf)
+            return
+
+        for offset in SLIDER_OFFSETS[kind]:
+            t = m + offset
+            p = board[t]
+            while p == 0:
+                if not captures:
+                    buf.append(s | SQUARE[t] << 6)
+                t += offset
+                p = board[t]
+            if p != OFF and p * pcolor < 0:
+                buf.append(s | SQUARE[t] << 6)
+
+    def attacked_map(self, by, ignore=None):
+        # NumberBoard.attacked_map, walking the mailbox
+        board = self.mailbox
+        attacked = [False] * 64
+        ignore = -1 if ignore is None else MAILBOX[ignore]
+        for s in range(64):
+            m = MAILBOX[s]
+            p = board[m] * by
+            if p <= 0:
+                continue
+            if p == 1 or p == 2 or p == 6:
+                if p == 1:
+                    offsets = PAWN_CAPTURE_OFFSETS[by]
+                else:
+                    offsets = KNIGHT_OFFSETS if p == 2 else KING_OFFSETS
+                for offset in offsets:
+                    if board[m + offset] != OFF:
+                        attacked[SQUARE[m + offset]] = True
+                continue
+            for offset in SLIDER_OFFSETS[p]:
+                t = m + offset
+                while board[t] != OFF:
+                    attacked[SQUARE[t]] = True
+                    if board[t] and t != ignore:
+                        break
+                    t += offset
+        return attacked
+
+    def attack_info(self, pcolor):
+        # NumberBoard.attack_info, walking the mailbox (same squares indexes out)
+        king = self.kings[pcolor]
+        ks = None if king is None else king[0] * 8 + king[1]
+        attacked = self.attacked_map(-pcolor, ks)
+        checkers = 0
+        evasions = set()
+        pins = {}
+        if king is None:
+            return king, attacked, checkers, evasions, pins
+        board = self.mailbox
+        enemy = -pcolor
+        km = MAILBOX[ks]
+
+        for offsets, checker in ((PAWN_CAPTURE_OFFSETS[pcolor], enemy), (KNIGHT_OFFSETS, 2 * enemy)):
+            for offset in offsets:
+                if board[km + offset] == checker:
+                    checkers += 1
+                    evasions.add(SQUARE[km + offset])
+
+        for sliders, offsets in (((4 * enemy, 5 * enemy), ROOK_OFFSETS), ((3 * enemy, 5 * enemy), BISHOP_OFFSETS)):
+            for offset in offsets:
+                ray = []
+                pinned = None
+                t = km + offset
+                p = board[t]
+                while p != OFF:
+                    ray.append(SQUARE[t])
+                    if p:
+                        if p in sliders:
+                            if pinned is None:
+                                checkers += 1
+                                evasions.update(ray)
+                            else:
+                                pins[pinned] = set(ray)
+                            break
+                        if p * pcolor < 0 or pinned is not None:
+                            break
+                        pinned = SQUARE[t]
+                    t += offset
+                    p = board[t]
+        return king, attacked, checkers, evasions, pins
+
+    def is_square_attacked(self, square, by):
+        # NumberBoard.is_square_attacked, walking the mailbox
+        board = self.mailbox
+        row, col = square
+        m = 21 + row * 10 + col
+        for offset in PAWN_CAPTURE_OFFSETS[-by]:
+            if board[m + offset] == by:
+                return True
+        for offset in KNIGHT_OFFSETS:
+            if board[m + offset] == 2 * by:
+                return True
+        for offset in KING_OFFSETS:
+            if board[m + offset] == 6 * by:
+                return True
+        for sliders, offsets in (((4 * by, 5 * by), ROOK_OFFSETS), ((3 * by, 5 * by), BISHOP_OFFSETS)):
+            for offset in offsets:
+                t = m + offset
+                p = board[t]
+                while p == 0:
+                    t += offset
+                    p = board[t]
+                if p in sliders:
+                    return True
+        return False
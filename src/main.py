@@ -7,7 +7,8 @@ from move import Move
 from sidebar import Sidebar
 from bot import Bot
 from piece import *
-from other_bot import find_best_move
+from other_bot import find_best_move, stop_workers, TT
+from move_cache import MOVE_CACHE
 from number_board import NumberBoard
 from time import time
 
@@ -98,21 +99,29 @@ class Main:
                 # Sound
                 game.play_sound(captured)
 
-                # if the bot is playing, make it's move and then move on
-                if self.bot_playing:
+                # if the bot is playing, make it's move and then move on,
+                # unless the human's move ended the game and there is none
+                game.check_game_over()
+                if self.bot_playing and not game.over:
                     start = time()
-                    best_move = find_best_move(board=board)
+                    best_move = find_best_move(
+                        board=board, movetime=BOT_MOVETIME, on_info=print if DEBUG_SEARCH else None
+                    )
                     end = time()
-                    print("found best move in "+str(end-start)+" seconds")
-                    captured = board.squares[best_move.final.row][
-                        best_move.final.col
-                    ].has_piece()
-                    best_piece = best_move.initial.piece
-
-                    board.move(best_piece, best_move, sidebar)
-
-                    game.play_sound(captured)
-                    game.next_turn()
+                    if DEBUG_SEARCH:
+                        print("found best move in "+str(end-start)+" seconds")
+                        print("transposition table: "+str(TT.stats()))
+                        print("move cache: "+str(MOVE_CACHE.stats()))
+                    if best_move is not None:
+                        captured = board.squares[best_move.final.row][
+                            best_move.final.col
+                        ].has_piece()
+                        best_piece = best_move.initial.piece
+
+                        board.move(best_piece, best_move, sidebar)
+
+                        game.play_sound(captured)
+                        game.next_turn()
 
                 # draw/show methods
                 game.show_bg(screen)
@@ -128,7 +137,8 @@ class Main:
                 # print(board.move_to_pgn(board.moves[-1]))
 
         dragger.undrag_piece()
-        game.check_game_over()
+        if not game.over:
+            game.check_game_over()
 
     def main_loop(self):
         screen = self.screen
@@ -193,6 +203,7 @@ class Main:
                     game.end_the_game()
             pygame.display.update()
         game.end_the_game(screen)
+        stop_workers()  # the bot's worker processes aren't needed anymore
 
     def start_loop(self):  # Start screen loop; this will render the start screen
         font = pygame.font.SysFont(
@@ -285,5 +296,7 @@ class Main:
 
 
 # Creation of a main object before running the game's main loop (the game itself).
-main = Main()
-main.start_loop()
\ No newline at end of file
+# (guarded, because the bot's worker processes may import this module)
+if __name__ == "__main__":
+    main = Main()
+    main.start_loop()
\ No newline at end of file
@@ -6,6 +6,7 @@ class Move:
         self.final = final
         self.is_a_capture = is_a_capture
         self.is_a_pawn_move = is_a_pawn_move
+        self.is_safe = True  # False if the piece can be won on final (see NumberBoard.see)
 
     def __eq__(self, other):
         return self.initial == other.initial and self.final == other.final
@@ -16,6 +17,9 @@ class Move:
     def is_it_a_capture(self):
         return self.is_a_capture
 
+    def is_it_safe(self):
+        return self.is_safe
+
     def pawn_move_or_capture(self):
         return self.is_a_pawn_move or self.is_a_capture
 
@@ -28,3 +32,6 @@ class Move:
     def set_pawn_move_and_capture(self, condition):
         self.is_a_capture = condition
         self.is_a_pawn_move = condition
+
+    def set_safe(self, condition):
+        self.is_safe = condition
@@ -0,0 +1,74 @@
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from const import *
+from number_board import decode_move
+
+
+@dataclass
+class LegalMoves:
+    # The legal moves of one color in one position, and what they mean for it
+    codes: array  # move codes, for the search
+    moves: list  # the same as number_board.Move objects
+    by_square: dict  # (row, col) -> the moves starting there
+    in_check: bool
+
+    def status(self):
+        # "checkmate", "stalemate", "check" or None
+        if not self.codes:
+            return "checkmate" if self.in_check else "stalemate"
+        return "check" if self.in_check else None
+
+
+class MoveCache:
+    # Least recently used cache of LegalMoves keyed by (NumberBoard.zobrist,
+    # color), so a position's moves are generated once however many times the
+    # GUI, the game-over check and the bot ask for them. Holds at most size
+    # positions, dropping the one asked for longest ago.
+    def __init__(self, size=MOVE_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, nb, pcolor):
+        key = (nb.zobrist, pcolor)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+        self.misses += 1
+        codes = nb.generate(pcolor, array("H"))
+        moves = [decode_move(code) for code in codes]
+        by_square = {}
+        for move in moves:
+            by_square.setdefault(move.start, []).append(move)
+        entry = LegalMoves(codes, moves, by_square, nb.in_check(pcolor))
+        self.entries[key] = entry
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return entry
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "positions": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate(), 4),
+        }
+
+
+# Shared by every Board and the bot
+MOVE_CACHE = MoveCache()
@@ -0,0 +1,40 @@
+from const import *
+
+KILLER_SLOTS = 2  # killer moves kept per ply
+
+
+class MoveOrdering:
+    # Killer moves and the history table, for ordering quiet moves.
+    # A killer is a quiet move that caused a beta cutoff at the same ply
+    # somewhere else in the tree; the history table adds up depth * depth for
+    # every quiet move that caused a cutoff, indexed by move & 4095 (its start
+    # and end squares). Both live for a whole search, over every depth of
+    # iterative deepening; new_search() is called between moves and clears the
+    # killers (their plies were counted from another root) and halves the
+    # history, so old scores count for less.
+    def __init__(self):
+        self.killers = []  # killers[ply], newest first
+        self.history = [0] * 4096
+
+    def new_search(self):
+        self.killers = []
+        self.history = [h >> 1 for h in self.history]
+
+    def clear(self):
+        self.killers = []
+        self.history = [0] * 4096
+
+    def killers_at(self, ply):
+        if ply < len(self.killers):
+            return self.killers[ply]
+        return ()
+
+    def cutoff(self, move, ply, depth):
+        # move is a quiet move that failed high at ply with depth left
+        while len(self.killers) <= ply:
+            self.killers.append([])
+        killers = self.killers[ply]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[KILLER_SLOTS:]
+        self.history[move & 4095] += depth * depth
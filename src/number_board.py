@@ -1,6 +1,7 @@
 from const import *
 from move import Move
-import copy
+from array import array
+import random
 from piece import *
 from time import time
 
@@ -80,33 +81,170 @@ class Move:
 
 @dataclass
 class HistoryMove:
+    # Everything take_back needs to undo a move without looking at the board
     start: tuple
     end: tuple
     moving: int
     taking: int
     color: int
+    taken_at: tuple  # where the taken piece stood, not end for en passant
+    rook_start: tuple  # castling only, where the rook came from and went to
+    rook_end: tuple
     old_en_passant: tuple
-    old_white_castleable: list[bool]
-    old_black_castleable: list[bool]
+    old_castling: int  # castling_index() before the move
+    old_zobrist: int
+    old_material: int
+    old_middlegame: int
+    old_endgame: int
+    old_signature: int
+    old_halfmove: int
+    # repetitions before an irreversible move (or a null move), which start
+    # a new count; None when the move only added to it
+    old_repetitions: dict = None
 
     @classmethod
     def fromMoveOn(cls, move, nb):
+        return cls.fromSquares(move.start, move.end, nb)
+
+    @classmethod
+    def fromSquares(cls, start, end, nb):
+        moving = nb.at(start)
+        taking = nb.at(end)
+        taken_at = end
+        rook_start = rook_end = None
+        sr, sc = start
+        er, ec = end
+        if moving == 1 or moving == -1:
+            if sc != ec and end == nb.en_passant:
+                taken_at = (sr, ec)
+                taking = -moving
+        elif (moving == 6 or moving == -6) and abs(ec - sc) == 2:
+            rook_start = (sr, 0 if ec < sc else 7)
+            rook_end = (sr, (sc + ec) // 2)
+        return cls(
+            start,
+            end,
+            moving,
+            taking,
+            color(moving),
+            taken_at,
+            rook_start,
+            rook_end,
+            nb.en_passant,
+            nb.castling_index(),
+            nb.zobrist,
+            nb.material,
+            nb.middlegame,
+            nb.endgame,
+            nb.signature,
+            nb.halfmove,
+        )
+
+    @classmethod
+    def null(cls, nb):
+        # a pass, see NumberBoard.make_null; start is None
         return cls(
-            move.start,
-            move.end,
-            nb.at(move.start),
-            nb.at(move.end),
-            color(nb.at(move.start)),
+            None,
+            None,
+            0,
+            0,
+            nb.side_to_move(),
+            None,
+            None,
+            None,
             nb.en_passant,
-            nb.white_castleable[:],
-            nb.black_castleable[:],
+            nb.castling_index(),
+            nb.zobrist,
+            nb.material,
+            nb.middlegame,
+            nb.endgame,
+            nb.signature,
+            nb.halfmove,
         )
 
 
+ASCII_PIECES = {
+    ".": 0,
+    "P": 1,
+    "N": 2,
+    "B": 3,
+    "R": 4,
+    "Q": 5,
+    "K": 6,
+    "k": -6,
+    "q": -5,
+    "r": -4,
+    "b": -3,
+    "n": -2,
+    "p": -1,
+}
+
 BLACK_START = 0
 WHITE_START = 7
 PST = [None, WHITE_START, BLACK_START]  # Piece Start
 
+KNIGHT_DELTAS = [(2, 1), (2, -1), (-2, -1), (-2, 1), (1, 2), (1, -2), (-1, -2), (-1, 2)]
+KING_DELTAS = [(1, -1), (1, 0), (1, 1), (0, -1), (0, 1), (-1, -1), (-1, 0), (-1, 1)]
+ROOK_DIRS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+BISHOP_DIRS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+QUEEN_DIRS = ROOK_DIRS + BISHOP_DIRS
+
+PAWN_START_ROWS = [None, 6, 1]
+PROMOTION_ROWS = [None, 0, 7]
+
+RC = [(s // 8, s % 8) for s in range(64)]  # square index (row * 8 + col) -> (row, col)
+
+
+def _targets(s, deltas):
+    row, col = RC[s]
+    return [
+        (row + dr) * 8 + col + dc
+        for dr, dc in deltas
+        if 0 <= row + dr < 8 and 0 <= col + dc < 8
+    ]
+
+
+def _ray(s, dr, dc):
+    row, col = RC[s]
+    squares = []
+    row, col = row + dr, col + dc
+    while 0 <= row < 8 and 0 <= col < 8:
+        squares.append(row * 8 + col)
+        row, col = row + dr, col + dc
+    return squares
+
+
+# Square lists for the generators, by square index
+KNIGHT_TARGETS = [_targets(s, KNIGHT_DELTAS) for s in range(64)]
+KING_TARGETS = [_targets(s, KING_DELTAS) for s in range(64)]
+# PAWN_TARGETS[color][s] is what a pawn of that color on s attacks (index -1 is black)
+PAWN_TARGETS = [
+    None,
+    [_targets(s, [(-1, -1), (-1, 1)]) for s in range(64)],
+    [_targets(s, [(1, -1), (1, 1)]) for s in range(64)],
+]
+# RAYS[s][d] walks out from s in direction QUEEN_DIRS[d], nearest square first
+RAYS = [[_ray(s, dr, dc) for dr, dc in QUEEN_DIRS] for s in range(64)]
+# the RAYS directions each slider (bishop, rook, queen) moves along
+SLIDER_RAYS = [None, None, None, range(4, 8), range(0, 4), range(8)]
+# and the other way round, the sliders that move along RAYS direction d
+SEE_SLIDERS = [(4, 5)] * 4 + [(3, 5)] * 4
+
+# Moves as 16 bit ints, so the generators and the search don't allocate an
+# object per move: bits 0-5 are the start square (row * 8 + col), 6-11 the
+# end square, 12-13 the promotion piece minus 2 and 14-15 one of these flags.
+# They only become Move objects at the edges (calc_moves and friends, the bot's
+# answer), see decode_move and NumberBoard.move_code.
+NORMAL_MOVE = 0
+PROMOTION_MOVE = 1
+EN_PASSANT_MOVE = 2
+CASTLE_MOVE = 3
+
+
+def decode_move(code):
+    promotion = (code >> 12 & 3) + 2 if code >> 14 == PROMOTION_MOVE else None
+    return Move(RC[code & 63], RC[code >> 6 & 63], promotion)
+
 
 def color(piece):
     if piece == 0:
@@ -114,6 +252,199 @@ def color(piece):
     return piece // abs(piece)
 
 
+# Piece-square bonuses used by evaluate_board, in tenths of a pawn like the
+# material, for white, as seen from white's side (a8 top left, indexed
+# row * 8 + col like the board). There is one set for the middlegame and one
+# for the endgame: evaluate_board blends the two by the game phase, so the
+# king hides behind its pawns while the queens are on and walks to the centre
+# once they are off, and pawns count for more the closer they are to
+# promoting as the board empties.
+_middlegame_values = {
+    # pawn
+    1: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 5, 5, 5, 5, 5, 5, 5,
+        1, 1, 2, 3, 3, 2, 1, 1,
+        0, 0, 1, 2, 2, 1, 0, 0,
+        0, 0, 0, 2, 2, 0, 0, 0,
+        0, 0, -1, 0, 0, -1, 0, 0,
+        0, 1, 1, -2, -2, 1, 1, 0,
+        0, 0, 0, 0, 0, 0, 0, 0,
+    ],
+    # knight
+    2: [
+        -5, -4, -3, -3, -3, -3, -4, -5,
+        -4, -2, 0, 0, 0, 0, -2, -4,
+        -3, 0, 1, 1, 1, 1, 0, -3,
+        -3, 0, 1, 2, 2, 1, 0, -3,
+        -3, 0, 1, 2, 2, 1, 0, -3,
+        -3, 0, 1, 1, 1, 1, 0, -3,
+        -4, -2, 0, 0, 0, 0, -2, -4,
+        -5, -4, -3, -3, -3, -3, -4, -5,
+    ],
+    # bishop
+    3: [
+        -2, -1, -1, -1, -1, -1, -1, -2,
+        -1, 0, 0, 0, 0, 0, 0, -1,
+        -1, 0, 0, 1, 1, 0, 0, -1,
+        -1, 0, 0, 1, 1, 0, 0, -1,
+        -1, 0, 1, 1, 1, 1, 0, -1,
+        -1, 1, 1, 1, 1, 1, 1, -1,
+        -1, 1, 0, 0, 0, 0, 1, -1,
+        -2, -1, -1, -1, -1, -1, -1, -2,
+    ],
+    # rook
+    4: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        1, 1, 1, 1, 1, 1, 1, 1,
+        -1, 0, 0, 0, 0, 0, 0, -1,
+        -1, 0, 0, 0, 0, 0, 0, -1,
+        -1, 0, 0, 0, 0, 0, 0, -1,
+        -1, 0, 0, 0, 0, 0, 0, -1,
+        -1, 0, 0, 0, 0, 0, 0, -1,
+        0, 0, 0, 1, 1, 0, 0, 0,
+    ],
+    # queen
+    5: [
+        -2, -1, -1, -1, -1, -1, -1, -2,
+        -1, 0, 0, 0, 0, 0, 0, -1,
+        -1, 0, 1, 1, 1, 1, 0, -1,
+        -1, 0, 1, 1, 1, 1, 0, -1,
+        -1, 0, 1, 1, 1, 1, 0, -1,
+        -1, 0, 1, 1, 1, 1, 0, -1,
+        -1, 0, 0, 0, 0, 0, 0, -1,
+        -2, -1, -1, -1, -1, -1, -1, -2,
+    ],
+    # king
+    6: [
+        -3, -4, -4, -5, -5, -4, -4, -3,
+        -3, -4, -4, -5, -5, -4, -4, -3,
+        -3, -4, -4, -5, -5, -4, -4, -3,
+        -3, -4, -4, -5, -5, -4, -4, -3,
+        -2, -3, -3, -4, -4, -3, -3, -2,
+        -1, -2, -2, -2, -2, -2, -2, -1,
+        2, 2, 0, 0, 0, 0, 2, 2,
+        2, 3, 1, 0, 0, 1, 3, 2,
+    ],
+}
+_endgame_values = dict(_middlegame_values)
+_endgame_values.update({
+    # pawn, the further up the better
+    1: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        8, 8, 8, 8, 8, 8, 8, 8,
+        5, 5, 5, 5, 5, 5, 5, 5,
+        3, 3, 3, 3, 3, 3, 3, 3,
+        2, 2, 2, 2, 2, 2, 2, 2,
+        1, 1, 1, 1, 1, 1, 1, 1,
+        0, 0, 0, 0, 0, 0, 0, 0,
+        0, 0, 0, 0, 0, 0, 0, 0,
+    ],
+    # rook, the seventh rank matters less without a king to shut in
+    4: [0] * 64,
+    # king, to the centre
+    6: [
+        -5, -4, -3, -2, -2, -3, -4, -5,
+        -3, -2, -1, 0, 0, -1, -2, -3,
+        -3, -1, 2, 3, 3, 2, -1, -3,
+        -3, -1, 3, 4, 4, 3, -1, -3,
+        -3, -1, 3, 4, 4, 3, -1, -3,
+        -3, -1, 2, 3, 3, 2, -1, -3,
+        -3, -3, 0, 0, 0, 0, -3, -3,
+        -5, -3, -3, -3, -3, -3, -3, -5,
+    ],
+})
+
+
+def _signed_tables(values):
+    # [piece][sq] for the signed piece ids (black pieces use the negative
+    # indices, like castleable): black's tables are white's turned upside
+    # down and negated
+    tables = [[0] * 64 for p in range(13)]
+    for kind, table in values.items():
+        tables[kind] = table
+        tables[-kind] = [-table[(7 - (sq >> 3)) * 8 + (sq & 7)] for sq in range(64)]
+    return tables
+
+
+MIDDLEGAME_TABLES = _signed_tables(_middlegame_values)
+ENDGAME_TABLES = _signed_tables(_endgame_values)
+
+# Material signature: the number of each piece on the board as 4 bit counts
+# in one int, so like the material it's kept up to date by adding and taking
+# away. SIGNATURE_TABLES[piece][sq] is what a piece on sq adds, indexed by
+# signed piece; bishops on light squares are counted apart from the ones on
+# dark squares, for the insufficient material draw.
+SIGNATURE_TABLES = [[0] * 64 for _p in range(13)]
+for _p in range(1, 13):
+    for _sq in range(64):
+        _slot = _p
+        if _p % 13 in (3, 10) and ((_sq >> 3) + _sq) % 2 == 0:  # a light square
+            _slot = 13 if _p == 3 else 14
+        SIGNATURE_TABLES[_p][_sq] = 1 << 4 * _slot
+
+
+def _side_signature(pcolor, pieces):
+    # the signature of pcolor's king and pieces, (piece, square) pairs
+    return SIGNATURE_TABLES[6 * pcolor][0] + sum(SIGNATURE_TABLES[p * pcolor][sq] for p, sq in pieces)
+
+
+def _insufficient_material():
+    # The signatures drawn by insufficient material: no pawns and a lone king
+    # against bishops all on squares of one color (or nothing), or at most
+    # four pieces on the board with each side holding a knight or a bishop,
+    # two knights, or nothing
+    knight, light, dark = (2, 0), (3, 0), (3, 1)  # a8 is light, b8 dark
+    drawn = set()
+    for bishop in light, dark:
+        for n in range(11):
+            drawn.add(((bishop,) * n, ()))
+    minors = [(), (knight,), (light,), (dark,)]
+    for a in minors:
+        for b in minors:
+            drawn.add((a, b))
+    drawn.add(((knight, knight), ()))
+    both_ways = drawn | {(b, a) for a, b in drawn}
+    return frozenset(_side_signature(1, a) + _side_signature(-1, b) for a, b in both_ways)
+
+
+INSUFFICIENT_MATERIAL = _insufficient_material()
+
+# Material in tenths of a pawn, so the running total stays exact (3.1 isn't a
+# float we can add and take away forever). Indexed by signed piece like above.
+_material_values = [0, 10, 30, 31, 50, 90, 100000]
+MATERIAL_VALUES = [
+    _material_values[p] if p <= 6 else -_material_values[13 - p] for p in range(13)
+]
+# Without the sign, for the static exchange evaluation
+SEE_VALUES = [abs(v) for v in MATERIAL_VALUES]
+# The same without pawns and kings, for each side's non-pawn material
+_non_pawn_values = [0, 0, 30, 31, 50, 90, 0]
+NON_PAWN_VALUES = [_non_pawn_values[p] if p <= 6 else _non_pawn_values[13 - p] for p in range(13)]
+# The game phase is the non-pawn material left on the board, both sides
+# together: PHASE_MATERIAL (all of it, as at the start) or more is pure
+# middlegame, 0 pure endgame
+PHASE_MATERIAL = 2 * (2 * 30 + 2 * 31 + 2 * 50 + 90)
+
+
+# Zobrist keys, from a fixed seed so keys are the same in every process.
+# PIECE_KEYS[piece][row * 8 + col], indexed by the signed piece id like
+# castleable is (black pieces use the negative indices), PIECE_KEYS[0] is zeros.
+_zobrist_random = random.Random(0x5EED)
+PIECE_KEYS = [[0] * 64] + [
+    [_zobrist_random.getrandbits(64) for sq in range(64)] for piece in range(12)
+]
+SIDE_KEY = _zobrist_random.getrandbits(64)  # xored in when black is to move
+EN_PASSANT_KEYS = [_zobrist_random.getrandbits(64) for col in range(COLS)]
+_castling_right_keys = [_zobrist_random.getrandbits(64) for right in range(4)]
+# CASTLING_KEYS[index], index bits: 1 white left, 2 white right, 4 black left, 8 black right
+CASTLING_KEYS = [0] * 16
+for _index in range(16):
+    for _right in range(4):
+        if _index >> _right & 1:
+            CASTLING_KEYS[_index] ^= _castling_right_keys[_right]
+
+
 class NumberBoard:
     def __init__(self, board=None):
         self.en_passant = None  # MUST BE: a tuple of (row, col)
@@ -121,8 +452,11 @@ class NumberBoard:
         self.black_castleable = [True, True]
         self.castleable = [None, self.white_castleable, self.black_castleable]
         self.move_number = 0
+        self.halfmove = 0  # moves since the last capture or pawn move, for the 50 move rule
         self.move_list = [] # Used to store all the moves made to get to a position
         self.possible_moves = [] # Used to store all of the possible moves in a given position: USED FOR CHESS ENGINE
+        self._scratch = array("H")  # pseudo legal moves of one piece, reused by generate
+        self.squares = [[0, 0, 0, 0, 0, 0, 0, 0] for col in range(COLS)]
         if board:
             self.move_number = board.counter
             self.squares = self.from_board(board)
@@ -130,6 +464,7 @@ class NumberBoard:
             self.white_castleable = self.castleable_from_board(board, 7)
             self.black_castleable = self.castleable_from_board(board, 0)
             self.castleable = [None, self.white_castleable, self.black_castleable]
+        self.refresh()
 
     def castleable_from_board(self, board, row):
         def unmoved_piece(cls, sq):
@@ -151,306 +486,135 @@ class NumberBoard:
         return number_board
 
     def copy(self):
-        nb = NumberBoard()
-        nb.squares = [row[:] for row in self.squares]
-        nb.en_passant = copy.deepcopy(self.en_passant)
+        # the same position without the move history; no __init__, the plain
+        # values are shared and the lists are copied
+        nb = type(self).__new__(type(self))
+        nb.__dict__.update(self.__dict__)
+        self._copy_pieces(nb)
         nb.white_castleable = self.white_castleable[:]
         nb.black_castleable = self.black_castleable[:]
         nb.castleable = [None, nb.white_castleable, nb.black_castleable]
+        nb.kings = self.kings[:]
+        nb.non_pawn = self.non_pawn[:]
+        nb.repetitions = dict(self.repetitions)  # the search sees repeats of game positions
+        nb.move_list = []
+        nb.possible_moves = []
+        nb._scratch = array("H")
         return nb
 
+    def _copy_pieces(self, nb):
+        # the piece placement part of copy(), for backends with their own layout
+        nb.squares = [row[:] for row in self.squares]
+
+    def castling_index(self):
+        w, b = self.white_castleable, self.black_castleable
+        return w[0] | w[1] << 1 | b[0] << 2 | b[1] << 3
+
+    def set_castling_index(self, index):
+        # in place, the castleable lists are shared with self.castleable
+        self.white_castleable[0] = bool(index & 1)
+        self.white_castleable[1] = bool(index & 2)
+        self.black_castleable[0] = bool(index & 4)
+        self.black_castleable[1] = bool(index & 8)
+
+    def en_passant_key(self):
+        # The en passant square only counts towards the key when a pawn of the
+        # side to move could actually take on it, so it doesn't split
+        # otherwise equal positions (for repetitions)
+        if self.en_passant is None:
+            return 0
+        er, ec = self.en_passant
+        pr = 4 if er == 5 else 3  # row of the pawn that just moved 2
+        taker = -self.squares[pr][ec]
+        if (ec > 0 and self.squares[pr][ec - 1] == taker) or (
+            ec < 7 and self.squares[pr][ec + 1] == taker
+        ):
+            return EN_PASSANT_KEYS[ec]
+        return 0
+
+    def compute_zobrist(self):
+        # Full recompute of the key, _tuple_move keeps it up to date after this
+        key = 0
+        for row in range(ROWS):
+            for col in range(COLS):
+                key ^= PIECE_KEYS[self.squares[row][col]][row * 8 + col]
+        if self.move_number % 2 == 1:
+            key ^= SIDE_KEY
+        return key ^ CASTLING_KEYS[self.castling_index()] ^ self.en_passant_key()
+
+    def refresh(self):
+        # Recomputes everything _tuple_move keeps up to date, after the squares
+        # were set some other way
+        self.kings = [None, self._find_king(1), self._find_king(-1)]
+        self.zobrist = self.compute_zobrist()
+        self.material = self.compute_material()
+        self.non_pawn = self.compute_non_pawn()
+        self.middlegame, self.endgame = self.compute_piece_squares()
+        self.signature = self.compute_signature()
+        # zobrist -> times the position was on the board since the last pawn
+        # move or capture (nothing before one can come back); the key already
+        # holds the side to move, castling rights and a takeable en passant
+        self.repetitions = {self.zobrist: 1}
+
+    def compute_material(self):
+        # Full recompute of self.material, in tenths of a pawn
+        return sum(MATERIAL_VALUES[p] for row in self.squares for p in row)
+
+    def compute_non_pawn(self):
+        # Full recompute of self.non_pawn: [None, white, black] knights,
+        # bishops, rooks and queens in tenths of a pawn (0 for a side with only
+        # pawns and a king, where a pass can be the best move)
+        non_pawn = [None, 0, 0]
+        for row in self.squares:
+            for p in row:
+                if p:
+                    non_pawn[color(p)] += NON_PAWN_VALUES[p]
+        return non_pawn
+
+    def compute_piece_squares(self):
+        # Full recompute of self.middlegame and self.endgame: the bonuses of
+        # every piece, see MIDDLEGAME_TABLES and ENDGAME_TABLES
+        middlegame = endgame = 0
+        sq = 0
+        for row in self.squares:
+            for p in row:
+                if p:
+                    middlegame += MIDDLEGAME_TABLES[p][sq]
+                    endgame += ENDGAME_TABLES[p][sq]
+                sq += 1
+        return middlegame, endgame
+
+    def compute_signature(self):
+        # Full recompute of self.signature, see SIGNATURE_TABLES
+        signature = 0
+        sq = 0
+        for row in self.squares:
+            for p in row:
+                signature += SIGNATURE_TABLES[p][sq]
+                sq += 1
+        return signature
+
+    def phase(self):
+        # how much of the middlegame is left, 0 to PHASE_MATERIAL
+        return min(self.non_pawn[1] + self.non_pawn[-1], PHASE_MATERIAL)
+
     def sevaluate_board(self):
-        val_map = [0, 1, 3, 3.1, 5, 9, 10000]
-        total = 0
-        for cols in range(0, 8):
-            for row in range(0, 8):
-                total += (
-                    color(self.squares[row][cols])
-                    * val_map[abs(self.squares[row][cols])]
-                )
-        return total
+        # Material balance in pawns, kept up to date by _tuple_move and take_back
+        if DEBUG_EVAL:
+            assert self.material == self.compute_material(), "material out of sync"
+        return self.material / 10
 
     def evaluate_board(self):
-        val_map = [0, 1, 3, 3, 5, 9, 10000]
-
-        # Evaluates the intrinsic value of a Pawn based on its position and squares controlled.
-        def pawn_eval(row, col, piece):
-            # Initially, the piece is worth the amount of points it has in the game by default
-            val = val_map[abs(piece)]
-            # Shorthanding the value sign of a piece.
-            vs = color(piece)  # piece.value_sign
-            # Evaluating pawns below purely based on the location of their board.
-            if (
-                row == 7 or row == 0
-            ):  # Pawns should not exist on these squares: they are promoted by then, so the piece they become is then used.
-                val += 0.0
-            elif (row == 6 and vs == 1) or (row == 1 and vs == -1):
-                if col == 0 or col == 7:
-                    val += vs * 0.5
-                elif col == 1 or col == 2 or col == 5 or col == 6:
-                    val += vs * 0.5
-                else:
-                    val += vs * -2.0
-            elif (row == 5 and vs == 1) or (row == 2 and vs == -1):
-                if col == 0 or col == 7:
-                    val += vs * 0.5
-                elif col == 1 or col == 6:
-                    val -= vs * 0.5
-                elif col == 2 or col == 5:
-                    val -= vs * 1.0
-            elif (row == 4 and vs == 1) or (row == 3 and vs == -1):
-                if col == 3 or col == 4:
-                    val += vs * 2.0
-            elif (row == 3 and vs == 1) or (row == 4 and vs == -1):
-                if col == 0 or col == 1 or col == 6 or col == 7:
-                    val += vs * 0.5
-                elif col == 2 or col == 5:
-                    val += vs * 1.0
-                else:
-                    val += vs * 2.5
-            elif (row == 2 and vs == 1) or (row == 5 and vs == -1):
-                if col == 0 or col == 1 or col == 6 or col == 7:
-                    val += vs * 1.0
-                elif col == 2 or col == 5:
-                    val += vs * 2.0
-                else:
-                    val += vs * 3.0
-            else:
-                val += vs * 5.0
-            return val  # Returns the instantaneous positional value of the pawn
-
-        def knight_eval(row, col, piece):
-            # Initially, the piece is worth the amount of points it has in the game by default
-            val = abs(piece)
-            # Shorthanding the value sign of a piece.
-            vs = color(piece)
-            # Evaluating knight(s) purely based on board location.
-            if row == 7 or row == 0:
-                if col == 0 or col == 7:
-                    val -= vs * 5.0
-                elif col == 1 or col == 6:
-                    val -= vs * 4.0
-                else:
-                    val -= vs * 3.0
-            elif (row == 6 and vs == 1) or (row == 1 and vs == -1):
-                if col == 0 or col == 7:
-                    val -= vs * 4.0
-                elif col == 1 or col == 6:
-                    val -= vs * 2.0
-                elif col == 3 or col == 4:
-                    val += vs * 0.5
-            elif (row == 5 and vs == 1) or (row == 2 and vs == -1):
-                if col == 0 or col == 7:
-                    val -= vs * 3.0
-                elif col == 1 or col == 6:
-                    val += vs * 0.5
-                elif col == 2 or col == 5:
-                    val += vs * 1.0
-                else:
-                    val += vs * 1.5
-            elif (row == 4 and vs == 1) or (row == 3 and vs == -1):
-                if col == 0 or col == 7:
-                    val -= vs * 3.0
-                elif col == 1 or col == 6:
-                    val += 0.0
-                elif col == 2 or col == 5:
-                    val += vs * 1.5
-                else:
-                    val += vs * 2.0
-            elif (row == 3 and vs == 1) or (row == 4 and vs == -1):
-                if col == 0 or col == 7:
-                    val -= vs * 3.0
-                elif col == 1 or col == 6:
-                    val += vs * 0.5
-                elif col == 2 or col == 5:
-                    val += vs * 1.5
-                else:
-                    val += vs * 2.0
-            elif (row == 2 and vs == 1) or (row == 5 and vs == -1):
-                if col == 0 or col == 7:
-                    val -= vs * 3.0
-                elif col == 1 or col == 6:
-                    val += 0.0
-                elif col == 2 or col == 5:
-                    val += vs * 1.0
-                else:
-                    val += vs * 1.5
-            elif (row == 1 and vs == -1) or (row == 6 and vs == -1):
-                if col == 0 or col == 7:
-                    val -= vs * 4.0
-                elif col == 1 or col == 6:
-                    val -= vs * 2.0
-            return val  # Returns the instantaneous potential value of the knight
-
-        def bishop_eval(row, col, piece):
-            # Initially, the piece is worth the amount of points it has in the game by default
-            val = abs(piece)
-            # Shorthanding the value sign of a piece.
-            vs = color(piece)
-            # Evaluating bishop(s) purely based on board location.
-            if row == 7 or row == 0:
-                if col == 0 or col == 7:
-                    val -= vs * -2.0
-                else:
-                    val -= vs * -1.0
-            elif (row == 6 and vs == 1) or (row == 1 and vs == -1):
-                if col == 0 or col == 7:
-                    val -= vs * 1.0
-                elif col == 1 or col == 6:
-                    val += vs * 0.5
-            elif (row == 5 and vs == 1) or (row == 2 and vs == -1):
-                if col == 0 or col == 7:
-                    val -= vs * 1.0
-                else:
-                    val += vs * 1.0
-            elif (row == 4 and vs == 1) or (row == 3 and vs == -1):
-                if col == 0 or col == 7:
-                    val -= vs * 1.0
-                elif col == 1 or col == 6:
-                    val += 0.0
-                else:
-                    val += vs * 1.0
-            elif (row == 3 and vs == 1) or (row == 4 and vs == -1):
-                if col == 0 or col == 7:
-                    val -= vs * 1.0
-                elif col == 1 or col == 2 or col == 5 or col == 6:
-                    val += vs * 0.5
-                else:
-                    val += vs * 1.0
-            elif (row == 2 and vs == 1) or (row == 5 and vs == -1):
-                if col == 0 or col == 7:
-                    val -= vs * -1.0
-                elif col == 1 or col == 6:
-                    val += 0.0
-                elif col == 2 or col == 5:
-                    val += vs * 0.5
-                else:
-                    val += vs * 1.0
-            else:
-                if col == 0 or col == 7:
-                    val -= vs * 1.0
-            return val  # Returns the instantaneous potential value of the bishop
-
-        def rook_eval(row, col, piece):
-            # Initially, the piece is worth the amount of points it has in the game by default
-            val = abs(piece)
-            # Shorthanding the value sign of a piece.
-            vs = color(piece)
-            # Evaluating rook(s) purely based on board location
-            if row == 7 or row == 0:
-                if col == 3 or col == 4:
-                    val += vs * 0.5
-            elif (row >= 2 and row <= 7 and vs == 1) or (
-                row <= 6 and row >= 1 and vs == -1
-            ):
-                if col == 0 or col == 7:
-                    val -= vs * 0.5
-            else:
-                if col == 0 or col == 7:
-                    val += vs * 0.5
-                else:
-                    val += vs * 1.0
-            return val  # Returns the instantaneous potential value of the rook
-
-        def queen_eval(row, col, piece):
-            # Initially, the piece is worth the amount of points it has in the game by default
-            val = abs(piece)
-            # Shorthanding the value sign of a piece.
-            vs = color(piece)
-            # Evaluating queen purely based on board location
-            if row == 7 or row == 0:
-                if col == 0 or col == 7:
-                    val -= vs * 2.0
-                elif col == 1 or col == 2 or col == 5 or col == 6:
-                    val -= vs * 1.0
-            elif (row == 6 and vs == 1) or (row == 1 and vs == -1):
-                if col == 0 or col == 7:
-                    val -= vs * -1.0
-                elif col == 2:
-                    val += vs * 0.5
-            elif (row == 5 and vs == 1) or (row == 2 and vs == -1):
-                if col == 0 or col == 7:
-                    val -= vs * -1.0
-                elif col != 6:
-                    val += vs * 0.5
-            elif (row == 4 and vs == 1) or (row == 3 and vs == -1):
-                if col == 7:
-                    val -= vs * 0.5
-                elif col == 2 or col == 3 or col == 4 or col == 5:
-                    val += vs * 0.5
-            elif (row == 3 and vs == 1) or (row == 4 and vs == -1):
-                if col == 0 or col == 7:
-                    val -= vs * 0.5
-                elif col != 1 or col != 6:
-                    val += vs * 0.5
-            elif (row == 2 and vs == 1) or (row == 5 and vs == -1):
-                if col == 0 or col == 7:
-                    val -= vs * 1.0
-                elif col != 1 or col != 6:
-                    val += vs * 0.5
-            else:
-                if col == 0 or col == 7:
-                    val -= vs * 1.0
-            return val  # Returns the instantaneous potential value of the queen
-
-        def king_eval(row, col, piece):
-            # Initially, the piece is worth the amount of points it has in the game by default
-            val = abs(piece)
-            # Shorthanding the value sign of a piece.
-            vs = color(piece)
-            # Evaluating king purely based on board location
-            if (row == 7 and vs == 1) or (row == 0 and vs == -1):
-                if col == 0 or col == 7:
-                    val += vs * 2.0
-                elif col == 1 or col == 6:
-                    val += vs * 3.0
-                elif col == 2 or col == 5:
-                    val += vs * 1.0
-            elif (row == 6 and vs == 1) or (row == 1 and vs == -1):
-                if col == 0 or col == 1 or col == 6 or col == 7:
-                    val += vs * 2.0
-            elif (row == 5 and vs == 1) or (row == 2 and vs == -1):
-                if col == 0 or col == 7:
-                    val -= vs * 1.0
-                else:
-                    val -= vs * 2.0
-            elif (row == 4 and vs == 1) or (row == 3 and vs == -1):
-                if col == 0 or col == 7:
-                    val -= vs * 2.0
-                elif col == 1 or col == 2 or col == 5 or col == 6:
-                    val -= vs * 3.0
-                else:
-                    val -= vs * 4.0
-            else:
-                if col == 0 or col == 7:
-                    val -= vs * 3.0
-                elif col == 1 or col == 2 or col == 5 or col == 6:
-                    val -= vs * 4.0
-                else:
-                    val -= vs * 5.0
-            return val  # Returns the instantaneous potential value of the king
-
-        # def pawn_eval(row, col, piece):
-        #     c = color(piece)
-        #     eval = c * val_map[piece]
-
-        eval = {
-            0: (lambda x, y, z: 0),
-            1: pawn_eval,
-            2: knight_eval,
-            3: bishop_eval,
-            4: rook_eval,
-            5: queen_eval,
-            6: king_eval,
-        }
-
-        total = 0
-        for cols in range(0, 8):
-            for row in range(0, 8):
-                total += eval[abs(self.squares[row][cols])](
-                    row, cols, self.squares[row][cols]
-                )
-        return total
+        # Material plus the piece-square bonuses, the middlegame and endgame
+        # ones blended by the game phase; in pawns, positive is good for white.
+        # Everything is kept up to date by _tuple_move and take_back
+        if DEBUG_EVAL:
+            assert self.material == self.compute_material(), "material out of sync"
+            assert self.non_pawn == self.compute_non_pawn(), "non-pawn material out of sync"
+            assert (self.middlegame, self.endgame) == self.compute_piece_squares(), "piece-square score out of sync"
+        phase = self.phase()
+        bonus = (self.middlegame * phase + self.endgame * (PHASE_MATERIAL - phase)) // PHASE_MATERIAL
+        return (self.material + bonus) / 10
 
     def testcm(self):
         number = 1000
@@ -462,6 +626,29 @@ class NumberBoard:
             total += end - start
         return total / number
 
+    def perft(self, depth):
+        # Counts the leaf nodes of the legal move tree, depth plies deep
+        if depth == 0:
+            return 1
+        moves = self.generate(self.side_to_move(), array("H"))
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for move in moves:
+            self.make(move)
+            nodes += self.perft(depth - 1)
+            self.take_back()
+        return nodes
+
+    def divide(self, depth):
+        # perft split by root move, {move string: nodes}, for finding generation bugs
+        counts = {}
+        for move in self.generate(self.side_to_move(), array("H")):
+            self.make(move)
+            counts[str(decode_move(move))] = self.perft(depth - 1)
+            self.take_back()
+        return counts
+
     def at(self, square):
         row, col = square
         return self.squares[row][col]
@@ -480,7 +667,50 @@ class NumberBoard:
     def move(self, move):
         hist_move = HistoryMove.fromMoveOn(move, self)
         self.move_list.append(hist_move)
-        return self._tuple_move(move.start, move.end, move.promotion)
+        self.move_number += 1
+        self._tuple_move(move.start, move.end, move.promotion)
+        self._count_position(hist_move)
+
+    def make(self, code):
+        # move() for a move code
+        start = RC[code & 63]
+        end = RC[code >> 6 & 63]
+        hist_move = HistoryMove.fromSquares(start, end, self)
+        self.move_list.append(hist_move)
+        self.move_number += 1
+        promotion = (code >> 12 & 3) + 2 if code >> 14 == PROMOTION_MOVE else None
+        self._tuple_move(start, end, promotion)
+        self._count_position(hist_move)
+
+    def _count_position(self, lm):
+        # adds the position lm led to to the repetitions and the halfmove clock
+        if lm.taking or lm.moving == lm.color:  # a capture or a pawn move
+            lm.old_repetitions = self.repetitions
+            self.repetitions = {self.zobrist: 1}
+            self.halfmove = 0
+        else:
+            self.repetitions[self.zobrist] = self.repetitions.get(self.zobrist, 0) + 1
+            self.halfmove += 1
+
+    def is_repetition(self):
+        # the position was on the board before, for draws inside the search
+        return self.repetitions[self.zobrist] > 1
+
+    def threefold_repetition(self):
+        return self.repetitions[self.zobrist] >= 3
+
+    def move_code(self, move):
+        # the move code of a Move to be played on this board
+        (sr, sc), (er, ec) = move.start, move.end
+        code = sr * 8 + sc | (er * 8 + ec) << 6
+        p = abs(self.squares[sr][sc])
+        if move.promotion:
+            code |= (move.promotion - 2) << 12 | PROMOTION_MOVE << 14
+        elif p == 1 and sc != ec and self.squares[er][ec] == 0:
+            code |= EN_PASSANT_MOVE << 14
+        elif p == 6 and abs(ec - sc) == 2:
+            code |= CASTLE_MOVE << 14
+        return code
 
     def _tuple_move(self, start, end, promotion=None):
         # p is the piece being moved
@@ -490,34 +720,78 @@ class NumberBoard:
         ep = self.en_passant  # saved for pawn checks
         ir, ic = start
         fr, fc = end
+        # take out the old rights, en passant and piece placement from the key
+        key = self.zobrist ^ SIDE_KEY ^ CASTLING_KEYS[self.castling_index()]
+        key ^= self.en_passant_key()
         self.en_passant = None
         # assert p != 0
+        taken = self.at(end)
+        pkeys = PIECE_KEYS[p]
+        key ^= pkeys[ir * 8 + ic] ^ pkeys[fr * 8 + fc] ^ PIECE_KEYS[taken][fr * 8 + fc]
+        # and the same for the evaluation
+        material = self.material - MATERIAL_VALUES[taken]
+        if taken:
+            self.non_pawn[color(taken)] -= NON_PAWN_VALUES[taken]
+        mg, eg = MIDDLEGAME_TABLES, ENDGAME_TABLES
+        s, e = ir * 8 + ic, fr * 8 + fc
+        middlegame = self.middlegame - mg[p][s] + mg[p][e] - mg[taken][e]
+        endgame = self.endgame - eg[p][s] + eg[p][e] - eg[taken][e]
+        sg = SIGNATURE_TABLES
+        signature = self.signature - sg[p][s] + sg[p][e] - sg[taken][e]
         self._move(start, end)
 
+        if abs(taken) == 4 and (fc == 0 or fc == 7) and fr == PST[color(taken)]:
+            # A rook taken on its starting square can no longer castle
+            self.castleable[color(taken)][(0 if fc == 0 else 1)] = False
+
         if abs(p) == 1:  # Pawn
             diff = fc - ic
             if diff != 0 and end == ep:
                 # If a pawn took onto en_passant square,
                 # delete the pawn that was next to it.
                 self.put((ir, ic + diff), 0)
+                key ^= PIECE_KEYS[-p][ir * 8 + fc]
+                material -= MATERIAL_VALUES[-p]
+                middlegame -= mg[-p][ir * 8 + fc]
+                endgame -= eg[-p][ir * 8 + fc]
+                signature -= sg[-p][ir * 8 + fc]
             elif abs(fr - ir) == 2:
                 self.en_passant = ((fr + ir) // 2, fc)  # avg of start and end is middle
             else:
                 pr = [None, 0, 7]  # promotion rows
                 if fr == pr[color(p)]:
                     self.put(end, promotion * color(p))
+                    key ^= pkeys[fr * 8 + fc] ^ PIECE_KEYS[promotion * color(p)][fr * 8 + fc]
+                    material += MATERIAL_VALUES[promotion * color(p)] - MATERIAL_VALUES[p]
+                    self.non_pawn[color(p)] += NON_PAWN_VALUES[promotion]
+                    middlegame += mg[promotion * color(p)][e] - mg[p][e]
+                    endgame += eg[promotion * color(p)][e] - eg[p][e]
+                    signature += sg[promotion * color(p)][e] - sg[p][e]
                     # Promote must be positive if it exists (see above assert)
         elif abs(p) == 6:  # King
-            self.castleable[color(p)] = [False, False]
+            self.kings[color(p)] = end
+            # mutate in place, so white_castleable/black_castleable stay in sync
+            self.castleable[color(p)][:] = [False, False]
             diff = fc - ic
             if abs(diff) == 2:  # king moved 2(sideways). must be a castle
                 rc = 0 if diff < 0 else 7  # rook column
-                self._tuple_move((ir, rc), (ir, abs(fc - ic // 2)))
+                self._move((ir, rc), (ir, (fc + ic) // 2))
                 # rook goes to avg of where king was/is
+                rkeys = PIECE_KEYS[4 * color(p)]
+                key ^= rkeys[ir * 8 + rc] ^ rkeys[ir * 8 + (fc + ic) // 2]
+                rook = 4 * color(p)
+                middlegame += mg[rook][ir * 8 + (fc + ic) // 2] - mg[rook][ir * 8 + rc]
+                endgame += eg[rook][ir * 8 + (fc + ic) // 2] - eg[rook][ir * 8 + rc]
         elif abs(p) == 4:  # Rook
             if (ic == 0 or ic == 7) and ir == PST[color(p)]:  #
                 self.castleable[color(p)][(0 if ic == 0 else 1)] = False
 
+        self.zobrist = key ^ CASTLING_KEYS[self.castling_index()] ^ self.en_passant_key()
+        self.material = material
+        self.middlegame = middlegame
+        self.endgame = endgame
+        self.signature = signature
+
     def in_board(self, square):
         row, col = square
         return 0 <= row < 8 and 0 <= col < 8
@@ -526,178 +800,87 @@ class NumberBoard:
         return [p for p in places if self.in_board(p)]
 
     def calc_moves_no_check(self, square):
-        if not(len(self.possible_moves) == 0 or self.possible_moves == None):
-            self.possible_moves.clear()
-
-        # NOT ALLOWED TO CALL IN_CHECK
-        def color(piece):
-            if piece == 0:
-                return 0
-            return piece // abs(piece)
-
-        # calculate all moves for a square
-        if self.at(square) == 0:
-            return []
+        # The pseudo legal moves of the piece on square, NOT checked for
+        # leaving the king in check
         row, col = square
-        pcolor = color(self.at(square))
-
-        def pawn():
-            def promotion_moves(move):
-                pfr = [None, 0, 7]
-                r, c = move
-                if r == pfr[pcolor]:
-                    return [Move(end=(r, c), promotion=p) for p in [2, 3, 4, 5]]
-                return [Move.end((r, c))]
-
-            pawn_ranks = [None, 6, 1]
-            ends = []
-            # row+1, ?row+2, (col+-1, row+1)
-            d = -pcolor
-            m = (row + d, col)
-            if self.in_board(m) and self.at(m) == 0:
-                ends.append(m)
-                m = (row + (d * 2), col)
-                if row == pawn_ranks[pcolor]:
-                    if self.at(m) == 0:
-                        ends.append(m)
-            m = (row + d, col + 1)
-            if (
-                self.in_board(m)
-                and color(self.at(m)) == -pcolor
-                or m == self.en_passant
-            ):
-                ends.append(m)
-            m = (row + d, col - 1)
-            if (
-                self.in_board(m)
-                and color(self.at(m)) == -pcolor
-                or m == self.en_passant
-            ):
-                ends.append(m)
-
-            ends = [end for end in ends if self.in_board(end)]
-            moves = [promotion_moves(end) for end in ends]
-            generated_moves = []
-            generated_moves.append([move for ms in moves for move in ms])
-            for move in generated_moves:
-                self.possible_moves.append(move)
-            return generated_moves
-
-        def knight():
-            possible_ends = [
-                (row + 2, col + 1),
-                (row + 2, col - 1),
-                (row - 2, col - 1),
-                (row - 2, col + 1),
-                (row + 1, col + 2),
-                (row + 1, col - 2),
-                (row - 1, col - 2),
-                (row - 1, col + 2),
-            ]
-            possible_ends = self.places_in_board(possible_ends)
-            generated_moves = [Move.end(e) for e in possible_ends if color(self.at(e)) != pcolor]
-            for move in generated_moves:
-                self.possible_moves.append(move)
-            return generated_moves
-
-        def bishop():
-            moves = []
-            moves.extend(straight_line_moves((1, 1)))
-            moves.extend(straight_line_moves((-1, 1)))
-            moves.extend(straight_line_moves((1, -1)))
-            moves.extend(straight_line_moves((-1, -1)))
-            for move in moves:
-                self.possible_moves.append(move)
-            return moves
-
-        def rook():
-            moves = []
-            moves.extend(straight_line_moves((1, 0)))
-            moves.extend(straight_line_moves((0, 1)))
-            moves.extend(straight_line_moves((-1, 0)))
-            moves.extend(straight_line_moves((0, -1)))
-            for move in moves:
-                self.possible_moves.append(move)
-            return moves
-
-        def queen():
-            moves = []
-            moves.extend(rook())
-            moves.extend(bishop())
-            for move in moves:
-                self.possible_moves.append(move)
-            return moves
-
-        def king():
-            possible_ends = [
-                (row + 1, col - 1),
-                (row + 1, col + 0),
-                (row + 1, col + 1),
-                (row + 0, col - 1),
-                (row + 0, col + 1),
-                (row - 1, col - 1),
-                (row - 1, col + 0),
-                (row - 1, col + 1),
-            ]
+        p = self.squares[row][col]
+        if p == 0:
+            return []
+        codes = array("H")
+        self._pseudo_codes(row * 8 + col, color(p), codes)
+        self.possible_moves[:] = moves = [decode_move(code) for code in codes]
+        return moves
 
-            possible_ends = self.places_in_board(possible_ends)
-
-            if (
-                self.castleable[pcolor][0]
-                and self.in_board(
-                    (row, col - 2)
-                )  # should not come up in an actual game, but useful for testing
-                and self.at((row, col - 1)) == 0
-                and self.at((row, col - 2)) == 0
-            ):
-                possible_ends.append((row, col - 2))
-            if (
-                self.castleable[pcolor][1]
-                and self.in_board(
-                    (row, col + 2)
-                )  # should not come up in an actual game, but useful for testing
-                and self.at((row, col + 1)) == 0
-                and self.at((row, col + 2)) == 0
-            ):
-                possible_ends.append((row, col + 2))
-            generated_moves = []
-            generated_moves.append([Move.end(e) for e in possible_ends if (color(self.at(e)) != pcolor)])
-            for move in generated_moves:
-                self.possible_moves.append(move)
-            return generated_moves
-
-        def straight_line_moves(direction):
+    def _pseudo_codes(self, s, pcolor, buf, captures=False):
+        # Appends the pseudo legal moves of the piece on square index s to buf
+        # as move codes, only captures and promotions if captures is set
+        squares = self.squares
+        row, col = RC[s]
+        kind = squares[row][col] * pcolor
+
+        if kind == 1:
+            r = row - pcolor
+            if not 0 <= r < 8:
+                return
+            promotion = r == PROMOTION_ROWS[pcolor]
             ends = []
-            drow, dcol = direction
-            mrow, mcol = row, col
-            mrow += drow
-            mcol += dcol
-            while self.in_board((mrow, mcol)):
-                p = self.at((mrow, mcol))
-
-                if color(p) == 0:
-                    ends.append((mrow, mcol))
-                elif color(p) == pcolor:
-                    break
-                elif -1 * color(p) == pcolor:  # p is rival color
-                    ends.append((mrow, mcol))
-                    break
-                mrow += drow
-                mcol += dcol
-            return [Move.end(e) for e in ends]
-
-        funcs = [lambda: [], pawn, knight, bishop, rook, queen, king]
-
-        return [
-            m.with_start(square) for m in funcs[abs(self.at(square))]()
-        ]  # if not self.in_check(square, m)
+            if squares[r][col] == 0 and (promotion or not captures):
+                ends.append(r * 8 + col)
+                if row == PAWN_START_ROWS[pcolor] and squares[r - pcolor][col] == 0:
+                    ends.append((r - pcolor) * 8 + col)
+            for c in (col - 1, col + 1):
+                if 0 <= c < 8:
+                    if squares[r][c] * pcolor < 0:
+                        ends.append(r * 8 + c)
+                    elif (r, c) == self.en_passant:
+                        buf.append(s | (r * 8 + c) << 6 | EN_PASSANT_MOVE << 14)
+            for e in ends:
+                if promotion:
+                    for bits in range(4):  # knight, bishop, rook, queen
+                        buf.append(s | e << 6 | bits << 12 | PROMOTION_MOVE << 14)
+                else:
+                    buf.append(s | e << 6)
+            return
+
+        if kind == 2 or kind == 6:
+            for e in KNIGHT_TARGETS[s] if kind == 2 else KING_TARGETS[s]:
+                p = squares[e >> 3][e & 7] * pcolor
+                if p < 0 or (p == 0 and not captures):
+                    buf.append(s | e << 6)
+            if kind == 6 and not captures:
+                self._castle_codes(s, pcolor, buf)
+            return
+
+        rays = RAYS[s]
+        for d in SLIDER_RAYS[kind]:
+            for e in rays[d]:
+                p = squares[e >> 3][e & 7] * pcolor
+                if p == 0:
+                    if not captures:
+                        buf.append(s | e << 6)
+                    continue
+                if p < 0:
+                    buf.append(s | e << 6)
+                break
+
+    def _castle_codes(self, s, pcolor, buf):
+        # castling only needs the right and the squares in between empty here,
+        # the legality test checks the king isn't in or passing through check
+        left, right = self.castleable[pcolor]
+        row, col = RC[s]
+        squares = self.squares[row]
+        if left and col >= 3 and not (squares[col - 1] or squares[col - 2] or squares[col - 3]):
+            buf.append(s | (s - 2) << 6 | CASTLE_MOVE << 14)
+        if right and col + 2 < 8 and not (squares[col + 1] or squares[col + 2]):
+            buf.append(s | (s + 2) << 6 | CASTLE_MOVE << 14)
 
     def valid_castle_move(self, move, color):
         # not in check, not moving through check
         sr, sc = move.start
         er, ec = move.end
-        halfway_move = Move(move.start, (sr, (sc + ec) // 2))
-        return not self.in_check(color) and not self.move_in_check(halfway_move, color)
+        return not self.is_square_attacked(move.start, -color) and not self.is_square_attacked(
+            (sr, (sc + ec) // 2), -color
+        )
 
     def valid_move(self, move, color):
         pt = abs(self.at(move.start))
@@ -708,25 +891,372 @@ class NumberBoard:
         return not self.move_in_check(move, color)
 
     def calc_moves(self, square):
-        # The moves returned here
-        moves = self.calc_moves_no_check(square)
-        pcolor = color(self.at(square))
-        # do the king castling thing.
-        return [m for m in moves if (self.valid_move(m, pcolor))]
+        # The legal moves of the piece on square
+        row, col = square
+        p = self.squares[row][col]
+        if p == 0:
+            return []
+        codes = array("H")
+        legal = array("H")
+        self._pseudo_codes(row * 8 + col, color(p), codes)
+        self._legal_codes(row * 8 + col, codes, self.attack_info(color(p)), legal)
+        return [decode_move(code) for code in legal]
+
+    def generate(self, pcolor, buf, captures=False):
+        # Appends the legal moves of pcolor to buf as move codes (only captures
+        # and promotions if captures is set) and returns buf
+        info = self.attack_info(pcolor)
+        scratch = self._scratch
+        squares = self.squares
+        for s in range(64):
+            if squares[s >> 3][s & 7] * pcolor > 0:
+                del scratch[:]
+                self._pseudo_codes(s, pcolor, scratch, captures)
+                self._legal_codes(s, scratch, info, buf)
+        return buf
+
+    def pick_moves(self, pcolor, tt_move=None, killers=(), history=None):
+        # Yields the legal moves of pcolor as move codes in stages, each stage
+        # only generated once the one before is used up, so when the search
+        # cuts off early the later stages are never worked out:
+        #   1. the hash move (checked on its own, nothing generated)
+        #   2. captures and promotions that don't lose material (see() at least
+        #      0), MVV-LVA order
+        #   3. the killer moves, if they are legal quiet moves here
+        #   4. the other quiet moves, by history score if history is given
+        #      (a list indexed by move & 4095, the start and end squares)
+        #   5. captures that lose material (see() below 0), least lost first
+        # The board may be moved on between yields as long as it's put back.
+        if tt_move is not None and self.is_legal_code(tt_move, pcolor):
+            yield tt_move
+
+        info = self.attack_info(pcolor)
+        squares = self.squares
+        own = [s for s in range(64) if squares[s >> 3][s & 7] * pcolor > 0]
+        scratch = array("H")
+        captures = array("H")
+        for s in own:
+            del scratch[:]
+            self._pseudo_codes(s, pcolor, scratch, True)
+            self._legal_codes(s, scratch, info, captures)
+        good = []
+        bad = []
+        for move in captures:
+            if move != tt_move:
+                (good if self.see(move) >= 0 else bad).append(move)
+        good.sort(key=self._mvv_lva, reverse=True)
+        yield from good
+
+        done = {tt_move}
+        for killer in killers:
+            if killer is None or killer in done or not self.is_quiet(killer):
+                continue
+            s = killer & 63
+            if squares[s >> 3][s & 7] * pcolor <= 0:
+                continue
+            del scratch[:]
+            legal = array("H")
+            self._pseudo_codes(s, pcolor, scratch)
+            self._legal_codes(s, scratch, info, legal)
+            if killer in legal:
+                done.add(killer)
+                yield killer
+
+        quiets = array("H")
+        for s in own:
+            del scratch[:]
+            self._pseudo_codes(s, pcolor, scratch)
+            self._legal_codes(s, scratch, info, quiets)
+        quiets = [move for move in quiets if self.is_quiet(move) and move not in done]
+        if history is not None:
+            quiets.sort(key=lambda move: history[move & 4095], reverse=True)
+        yield from quiets
+
+        bad.sort(key=self.see, reverse=True)
+        yield from bad
+
+    def is_legal_code(self, code, pcolor):
+        # Whether a move code is legal for pcolor here, without generating all
+        # the moves (a hash move may come from a position with the same key)
+        s = code & 63
+        if self.squares[s >> 3][s & 7] * pcolor <= 0:
+            return False
+        pseudo = array("H")
+        self._pseudo_codes(s, pcolor, pseudo)
+        if code not in pseudo:
+            return False
+        if code >> 14 == CASTLE_MOVE:
+            passed = RC[(s + (code >> 6 & 63)) >> 1]
+            if self.is_square_attacked(RC[s], -pcolor) or self.is_square_attacked(passed, -pcolor):
+                return False
+        self.make(code)
+        legal = not self.in_check(pcolor)
+        self.take_back()
+        return legal
+
+    def is_quiet(self, move):
+        # not a capture, en passant or promotion
+        e = move >> 6 & 63
+        flag = move >> 14
+        return self.squares[e >> 3][e & 7] == 0 and (flag == NORMAL_MOVE or flag == CASTLE_MOVE)
+
+    def _mvv_lva(self, move):
+        # most valuable victim first, least valuable attacker among equal victims
+        s, e = move & 63, move >> 6 & 63
+        victim = abs(self.squares[e >> 3][e & 7])
+        if move >> 14 == PROMOTION_MOVE:
+            victim += (move >> 12 & 3) + 1  # what the pawn becomes, less the pawn
+        return victim * 8 - abs(self.squares[s >> 3][s & 7])
+
+    def see(self, move):
+        # Static exchange evaluation of a move code, for the side making it:
+        # the material (tenths of a pawn, like self.material) it ends up with if
+        # both sides keep taking on the end square, cheapest piece first, each
+        # free to stop when taking again doesn't pay. Pieces lined up behind an
+        # attacker on the same line (x-rays) join in once it has taken; pins
+        # are ignored. Only reads the squares, nothing is moved or copied.
+        # A quiet move scores below 0 when the piece can be won there.
+        squares = self.squares
+        s, e = move & 63, move >> 6 & 63
+        flag = move >> 14
+        if flag == CASTLE_MOVE:
+            return 0
+        values = SEE_VALUES
+        mover = squares[s >> 3][s & 7]
+        pcolor = 1 if mover > 0 else -1
+        gain = values[squares[e >> 3][e & 7]]
+        on = values[mover]  # value of the piece now on e
+        if flag == EN_PASSANT_MOVE:
+            gain = values[1]
+        elif flag == PROMOTION_MOVE:
+            on = values[(move >> 12 & 3) + 2]
+            gain += on - values[1]
+
+        # The attackers of e: the number of knights of each color, and on each
+        # line out from e the pieces that can take along it one after the
+        # other, nearest last (so the next one to take is ray[-1])
+        knights = [None, 0, 0]
+        for t in KNIGHT_TARGETS[e]:
+            p = squares[t >> 3][t & 7]
+            if p == 2 or p == -2:
+                knights[p // 2] += 1
+        if mover == 2 * pcolor:
+            knights[pcolor] -= 1
+        rays = []
+        for d in range(8):
+            sliders = SEE_SLIDERS[d]
+            ray = []
+            for i, t in enumerate(RAYS[e][d]):
+                p = squares[t >> 3][t & 7]
+                if p == 0 or t == s:
+                    continue  # the mover has left its square already
+                kind = p if p > 0 else -p
+                if not (
+                    kind in sliders
+                    or i == 0  # next to e, kings and pawns take too
+                    and (kind == 6 or kind == 1 and d >= 4 and QUEEN_DIRS[d][0] == (1 if p > 0 else -1))
+                ):
+                    break
+                ray.append(p)
+            if ray:
+                ray.reverse()
+                rays.append(ray)
+
+        swaps = [gain]
+        side = -pcolor
+        while True:
+            taker = None
+            value = 0
+            if knights[side]:
+                taker, value = knights, values[2]
+            for ray in rays:
+                if ray and ray[-1] * side > 0 and (taker is None or values[ray[-1]] < value):
+                    taker, value = ray, values[ray[-1]]
+            if taker is None:
+                break
+            if taker is knights:
+                knights[side] -= 1
+            else:
+                taker.pop()
+            if value == values[6] and (knights[-side] or any(ray and ray[-1] * side < 0 for ray in rays)):
+                break  # the king can't take a defended piece
+            if value == values[1] and (e < 8 or e >= 56):
+                swaps.append(on + values[5] - value - swaps[-1])  # and promotes
+                on = values[5]
+            else:
+                swaps.append(on - swaps[-1])
+                on = value
+            side = -side
+        # each side takes on only if it's better than stopping
+        for i in range(len(swaps) - 1, 0, -1):
+            swaps[i - 1] = -max(-swaps[i - 1], swaps[i])
+        return swaps[0]
+
+    def _find_king(self, pcolor):
+        for row in range(ROWS):
+            for col in range(COLS):
+                if self.squares[row][col] == 6 * pcolor:
+                    return (row, col)
+        return None
+
+    def attacked_map(self, by, ignore=None):
+        # attacked[s] is True when a piece of color by attacks square index s.
+        # Sliders see through the square ignore, which is the defending king, so
+        # it can't step back along the ray it is checked on.
+        squares = self.squares
+        attacked = [False] * 64
+        for s in range(64):
+            p = squares[s >> 3][s & 7] * by
+            if p <= 0:
+                continue
+            if p == 1:
+                for e in PAWN_TARGETS[by][s]:
+                    attacked[e] = True
+            elif p == 2 or p == 6:
+                for e in KNIGHT_TARGETS[s] if p == 2 else KING_TARGETS[s]:
+                    attacked[e] = True
+            else:
+                rays = RAYS[s]
+                for d in SLIDER_RAYS[p]:
+                    for e in rays[d]:
+                        attacked[e] = True
+                        if squares[e >> 3][e & 7] and e != ignore:
+                            break
+        return attacked
+
+    def attack_info(self, pcolor):
+        # Everything legal move generation needs to know about pcolor's king,
+        # worked out once per position: (king, attacked, checkers, evasions, pins)
+        #   attacked: attacked_map of the other side, seeing through the king
+        #   checkers: how many pieces give check
+        #   evasions: with one checker, the squares that take it or block it
+        #   pins: {pinned square: the squares it may still move to}
+        # squares here are square indexes, except king which is (row, col)
+        king = self.kings[pcolor]
+        ks = None if king is None else king[0] * 8 + king[1]
+        attacked = self.attacked_map(-pcolor, ks)
+        checkers = 0
+        evasions = set()
+        pins = {}
+        if king is None:
+            return king, attacked, checkers, evasions, pins
+        squares = self.squares
+        enemy = -pcolor
+
+        # a pawn checks the king from where our own pawn would attack
+        for e in PAWN_TARGETS[pcolor][ks]:
+            if squares[e >> 3][e & 7] == enemy:
+                checkers += 1
+                evasions.add(e)
+        for e in KNIGHT_TARGETS[ks]:
+            if squares[e >> 3][e & 7] == 2 * enemy:
+                checkers += 1
+                evasions.add(e)
+
+        # walk out from the king: an enemy slider is a check, or a pin if one
+        # of our pieces stands between
+        for d, ray in enumerate(RAYS[ks]):
+            sliders = (4 * enemy if d < 4 else 3 * enemy, 5 * enemy)
+            pinned = None
+            for i, e in enumerate(ray):
+                p = squares[e >> 3][e & 7]
+                if p:
+                    if p in sliders:
+                        if pinned is None:
+                            checkers += 1
+                            evasions.update(ray[: i + 1])
+                        else:
+                            pins[pinned] = set(ray[: i + 1])
+                        break
+                    if p * pcolor < 0 or pinned is not None:
+                        break
+                    pinned = e
+        return king, attacked, checkers, evasions, pins
+
+    def _legal_codes(self, s, codes, info, out):
+        # Appends the legal ones of the pseudo legal move codes of the piece on
+        # square index s to out
+        king, attacked, checkers, evasions, pins = info
+        if abs(self.squares[s >> 3][s & 7]) == 6:
+            for code in codes:
+                e = code >> 6 & 63
+                if attacked[e]:
+                    continue
+                # no castling out of or through check
+                if code >> 14 == CASTLE_MOVE and (checkers or attacked[(s + e) >> 1]):
+                    continue
+                out.append(code)
+            return
+        if checkers > 1:
+            return  # double check, only the king can move
+        pin = pins.get(s)
+        for code in codes:
+            e = code >> 6 & 63
+            if pin is not None and e not in pin:
+                continue
+            if code >> 14 == EN_PASSANT_MOVE:
+                if self._en_passant_legal(code, king, checkers, evasions):
+                    out.append(code)
+                continue
+            if checkers and e not in evasions:
+                continue
+            out.append(code)
+
+    def _en_passant_legal(self, code, king, checkers, evasions):
+        (ir, ic), (fr, fc) = RC[code & 63], RC[code >> 6 & 63]
+        if checkers and ir * 8 + fc not in evasions and fr * 8 + fc not in evasions:
+            return False
+        if king is None:
+            return True
+        # Two pawns leave the row at once, so the pin test can't see a rook
+        # behind them: put the capture on the board (just the pieces, it's
+        # undone straight away) and look again
+        p = self.squares[ir][ic]
+        taken = self.squares[ir][fc]
+        self.put((ir, ic), 0)
+        self.put((ir, fc), 0)
+        self.put((fr, fc), p)
+        safe = not self.is_square_attacked(king, -color(p))
+        self.put((fr, fc), 0)
+        self.put((ir, fc), taken)
+        self.put((ir, ic), p)
+        return safe
 
     def move_in_check(self, move, color):
-        nb = self.copy()
-        nb.move(move)
-        return nb.in_check(color)
+        # make/unmake on this board, no copy
+        self.move(move)
+        check = self.in_check(color)
+        self.take_back()
+        return check
 
     def in_check(self, color):
-        for row in range(ROWS):
-            for col in range(COLS):
-                moves = self.calc_moves_no_check((row, col))
-                for move in moves:
-                    p = self.at(move.end)
-                    if p == 6 * color:
+        king = self.kings[color]
+        return king is not None and self.is_square_attacked(king, -color)
+
+    def is_square_attacked(self, square, by):
+        # Is square attacked by a piece of color by, looking out from the square
+        # for each kind of attacker rather than generating the attackers' moves
+        squares = self.squares
+        row, col = square
+        s = row * 8 + col
+        # a pawn of color by attacks s from where a pawn of ours on s would attack
+        for e in PAWN_TARGETS[-by][s]:
+            if squares[e >> 3][e & 7] == by:
+                return True
+        for e in KNIGHT_TARGETS[s]:
+            if squares[e >> 3][e & 7] == 2 * by:
+                return True
+        for e in KING_TARGETS[s]:
+            if squares[e >> 3][e & 7] == 6 * by:
+                return True
+        for d, ray in enumerate(RAYS[s]):
+            sliders = (4 * by if d < 4 else 3 * by, 5 * by)
+            for e in ray:
+                p = squares[e >> 3][e & 7]
+                if p:
+                    if p in sliders:
                         return True
+                    break
         return False
 
     def print(self, guides=False):
@@ -751,113 +1281,142 @@ class NumberBoard:
 
     def from_string(self, string):
         counter = 0
-        d = {
-            ".": 0,
-            "P": 1,
-            "N": 2,
-            "B": 3,
-            "R": 4,
-            "Q": 5,
-            "K": 6,
-            "k": -6,
-            "q": -5,
-            "r": -4,
-            "b": -3,
-            "n": -2,
-            "p": -1,
-        }
+        d = ASCII_PIECES
         for token in string.split():
             x = counter % 8
             y = counter // 8
             self.squares[y][x] = d[token]
             counter += 1
+        self.refresh()
+
+    def from_fen(self, fen):
+        # Sets up the position from a FEN string
+        fields = fen.split()
+        for row, rank in enumerate(fields[0].split("/")):
+            col = 0
+            for token in rank:
+                if token.isdigit():
+                    for _ in range(int(token)):
+                        self.put((row, col), 0)
+                        col += 1
+                else:
+                    self.put((row, col), ASCII_PIECES[token])
+                    col += 1
+
+        rights = fields[2] if len(fields) > 2 else "-"
+        self.white_castleable[:] = ["Q" in rights, "K" in rights]
+        self.black_castleable[:] = ["q" in rights, "k" in rights]
+
+        ep = fields[3] if len(fields) > 3 else "-"
+        self.en_passant = None if ep == "-" else (8 - int(ep[1]), ord(ep[0]) - ord("a"))
+
+        self.halfmove = int(fields[4]) if len(fields) > 4 else 0
+        full_moves = int(fields[5]) if len(fields) > 5 else 1
+        self.move_number = 2 * (full_moves - 1) + (0 if fields[1] == "w" else 1)
+        self.move_list = []
+        self.refresh()
+        return self
+
+    def side_to_move(self):
+        return 1 if self.move_number % 2 == 0 else -1
 
     def calc_color_moves(self, pcolor):
-        moves = []
-        for row in range(ROWS):
-            for col in range(COLS):
-                p = self.at((row, col))
-                if color(p) == pcolor:
-                    moves.extend(self.calc_moves((row, col)))
-        return moves
+        return [decode_move(code) for code in self.generate(pcolor, array("H"))]
 
-    def draw_by_insufficient_material(self):
-        def all_light_square_bishops(c):
-            def sq_color(x, y):
-                # ((x + y) % 2) gets the color as a 0 or a 1, but I want that as a -1 or a +1
-                return 1 if ((x + y) % 2) else -1  # 0 as False, everything else as true
-
-            cps = [p for p in ps if color(p) == c and abs(p) != 6]
-            if all(abs(p) == 3 for p in cps):
-                # (assume cs is colors is already there is a matrix, and c is the color is already there)
-                # bs =. (3=|).*(c=*)/ board
-                # ,(bs * cs)
-                # */ (= {.) -.&0 bs
-                # returns 1 if all bishops on same color
-                colors = [
-                    sq_color(x, y) for x in range(8) for y in range(8)
-                ]  # generate a list of colors in the board, -1 is one color, 1 is the other
-                bishops = [
-                    (color(p) == c and abs(p) == 3) for row in self.squares for p in row
-                ]  # bishop mask
-                bishop_colors = [
-                    b * c for b, c in zip(bishops, colors)
-                ]  # multiply color by bishop mask
-                bishops_list = [
-                    p for p in bishop_colors if p != 0
-                ]  # get only the bishops
-                if all(bishops_list[0] == p for p in bishops_list):
-                    return True  # return true if they all are the same
-            return False
+    def calc_color_captures(self, pcolor):
+        # Only the legal captures (en passant included) and promotions, for the
+        # quiescence search
+        return [decode_move(code) for code in self.generate(pcolor, array("H"), True)]
 
-        def side_insufficient_material(c, ps):
-            cps = [p for p in ps if color(p) == c and abs(p) != 6]
-            if len(cps) == 0:
-                return True
-            # Color has more than 2 non-king pieces
-            if len(cps) > 2:
-                return False
-            # Color has 2 knights
-            if len(cps) == 2 and all(abs(p) == 2 for p in cps):
-                return True
-            # Color has 2 pieces, both of which are not knights
-            # Color has 2 bishops, both of which are the same color
-            if all(abs(p) == 3 for p in cps) and len(cps) == 2:
-                if all_light_square_bishops(c):
+    def draw_by_insufficient_material(self):
+        # Neither side can mate, looked up by the material signature
+        if DEBUG_EVAL:
+            assert self.signature == self.compute_signature(), "material signature out of sync"
+        return self.signature in INSUFFICIENT_MATERIAL
+
+    def has_legal_move(self, pcolor):
+        # generate() that stops at the first legal move it finds
+        info = self.attack_info(pcolor)
+        scratch = self._scratch
+        squares = self.squares
+        legal = []
+        for s in range(64):
+            if squares[s >> 3][s & 7] * pcolor > 0:
+                del scratch[:]
+                self._pseudo_codes(s, pcolor, scratch)
+                self._legal_codes(s, scratch, info, legal)
+                if legal:
                     return True
-            # Color has 2 pieces, both of which aren't knights, and both of which are not bishops on the same color
-            if len(cps) == 2:
-                return False
-            p = cps[0]  # only one piece
-            if abs(p) == 2 or abs(p) == 3:
-                return True  # Bishop or knight
-            # Color has one piece (non-king), which is not a bishop or a knight
-            return False
+        return False
 
-        # no pawns
-        ps = [p for row in self.squares for p in row if p != 0]
-        if any(abs(p) == 1 for p in ps):
-            return False  # Pawns
-        if all_light_square_bishops(1) and all(
-            abs(p) == 6 for p in ps if color(p) == -1
-        ):
-            return True
-        if all_light_square_bishops(-1) and all(
-            abs(p) == 6 for p in ps if color(p) == 1
-        ):
-            return True
-        if len(ps) >= 5:
-            return False  # At least 5 pieces on the board
-        # (There is a possible forced mate)
-        # If one side has a king and 2 knights, the other side has a king and one piece
-        # each colors pieces, excluding kings
-        return side_insufficient_material(1, ps) and side_insufficient_material(-1, ps)
+    def draw_status(self):
+        # Which draw rule ends the game here, or None: "fifty moves",
+        # "repetition" or "insufficient material". All O(1), the clock, the
+        # repetitions and the material signature are kept up to date by the
+        # moves; checkmate and stalemate come from the legal moves
+        if self.halfmove >= 100:
+            return "fifty moves"
+        if self.threefold_repetition():
+            return "repetition"
+        if self.draw_by_insufficient_material():
+            return "insufficient material"
+        return None
 
     def take_back(self):
         lm = self.move_list.pop()
-        self.put(lm.start, lm.moving)
-        self.put(lm.end, lm.taking)
+        self.move_number -= 1
+        if lm.old_repetitions is None:
+            count = self.repetitions[self.zobrist] - 1
+            if count:
+                self.repetitions[self.zobrist] = count
+            else:
+                del self.repetitions[self.zobrist]
+        else:
+            self.repetitions = lm.old_repetitions
+        if lm.moving == lm.color and lm.end[0] == PROMOTION_ROWS[lm.color]:
+            self.non_pawn[lm.color] -= NON_PAWN_VALUES[self.at(lm.end)]
+        self.put(lm.start, lm.moving)  # also undoes a promotion
+        if lm.taken_at == lm.end:
+            self.put(lm.end, lm.taking)
+        else:
+            # en passant, the end square was empty
+            self.put(lm.end, 0)
+            self.put(lm.taken_at, lm.taking)
+        if lm.rook_start:
+            self._move(lm.rook_end, lm.rook_start)
+        if lm.moving == 6 * lm.color:
+            self.kings[lm.color] = lm.start
         self.en_passant = lm.old_en_passant
-        self.white_castleable = lm.old_white_castleable[:]
-        self.black_castleable = lm.old_black_castleable[:]
-        self.castleable = [None, self.white_castleable, self.black_castleable]
\ No newline at end of file
+        self.set_castling_index(lm.old_castling)
+        self.zobrist = lm.old_zobrist
+        self.material = lm.old_material
+        self.middlegame = lm.old_middlegame
+        self.endgame = lm.old_endgame
+        self.signature = lm.old_signature
+        self.halfmove = lm.old_halfmove
+        if lm.taking:
+            self.non_pawn[-lm.color] += NON_PAWN_VALUES[lm.taking]
+
+    def make_null(self):
+        # Passes the turn without moving, for null move pruning in the search.
+        # Undo with take_back_null; nothing but the side to move, the en
+        # passant square and the key change, but it goes on move_list like a
+        # move so the search's ply count stays right. A pass is no real move,
+        # so no repetition is counted across it
+        lm = HistoryMove.null(self)
+        lm.old_repetitions = self.repetitions
+        self.move_list.append(lm)
+        self.move_number += 1
+        self.zobrist ^= SIDE_KEY ^ self.en_passant_key()
+        self.en_passant = None
+        self.repetitions = {self.zobrist: 1}
+
+    def take_back_null(self):
+        lm = self.move_list.pop()
+        self.move_number -= 1
+        self.en_passant = lm.old_en_passant
+        self.zobrist = lm.old_zobrist
+        self.repetitions = lm.old_repetitions
+
+    def last_move_null(self):
+        return bool(self.move_list) and self.move_list[-1].start is None
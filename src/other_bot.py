@@ -1,8 +1,83 @@
 #!/usr/bin/env python3
-from multiprocessing import Pool
-from number_board import NumberBoard
+import atexit
+from array import array
+from multiprocessing import Pool, Value
+from number_board import decode_move, PROMOTION_MOVE
+from backend import new_board
+from transposition_table import TranspositionTable, EXACT, LOWER, UPPER
+from move_ordering import MoveOrdering
+from move_cache import MOVE_CACHE
 from move import *
-from time import time, sleep
+from const import *
+from time import time
+
+# Shared by every root move and every search, so transpositions found while
+# searching one move are reused by the others
+TT = TranspositionTable()
+# Killer moves and history scores, kept between depths and aged between moves
+ORDERING = MoveOrdering()
+
+PIECE_VALUES = [0, 1, 3, 3, 5, 9, 10000]
+# A capture that can't bring the score within this many pawns of alpha, even
+# winning the piece for free, is skipped by the quiescence search
+DELTA_MARGIN = 2
+
+# Null move pruning: the pass is searched this many plies shallower than a
+# real move would be, and only with at least NULL_MOVE_MIN_DEPTH plies left
+NULL_MOVE_R = 2
+NULL_MOVE_MIN_DEPTH = 3
+# Late move reductions: from the LMR_MIN_MOVES'th move on (counting from 0),
+# with at least LMR_MIN_DEPTH plies left, quiet moves go one ply shallower
+# (two after LMR_DEEP_MOVES moves) with a null window first
+LMR_MIN_MOVES = 3
+LMR_DEEP_MOVES = 8
+LMR_MIN_DEPTH = 3
+# Scores are kept in tenths of a pawn, so nothing fits strictly between
+# alpha and alpha + WINDOW: (alpha, alpha + WINDOW) is a null window
+WINDOW = 0.01
+# Iterative deepening searches each depth in a window this many pawns either
+# side of the last depth's score, widening it (doubling the margin) on the
+# side the score falls out of; past ASPIRATION_MAX that side is opened fully
+ASPIRATION_WINDOW = 0.5
+ASPIRATION_MAX = 4
+
+
+class SearchTimeout(Exception):
+    # raised inside the search when the time budget runs out
+    pass
+
+
+class SearchState:
+    # What all the nodes of one search share
+    def __init__(self, tt=TT, deadline=None, ordering=ORDERING):
+        self.tt = tt
+        self.ordering = ordering if SEARCH_HISTORY else None
+        self.deadline = deadline  # time() after which the search gives up
+        self.nodes = 0  # full width nodes
+        self.qnodes = 0  # quiescence nodes
+        self.buffers = []  # move code buffers, one per ply
+        self.pv = {}  # ply -> best line found from there, move codes
+        self.researches = 0  # root searches repeated after an aspiration fail
+
+    def buffer(self, ply):
+        # the move buffer of this ply, emptied; each ply keeps reusing its own,
+        # so generating moves allocates nothing new
+        buffers = self.buffers
+        while len(buffers) <= ply:
+            buffers.append(array("H"))
+        buf = buffers[ply]
+        del buf[:]
+        return buf
+
+    def count_node(self):
+        self.nodes += 1
+        if self.deadline is not None and time() > self.deadline:
+            raise SearchTimeout
+
+    def count_qnode(self):
+        self.qnodes += 1
+        if self.deadline is not None and time() > self.deadline:
+            raise SearchTimeout
 
 
 def tbm(b, nm):
@@ -11,70 +86,453 @@ def tbm(b, nm):
     return Move(sq, eq)
 
 
-# Thanks Sebastian Lague
-def ab(board, depth, white):
-    def order_moves(moves, board):
-        # pv : piece value
-        # cv : captured piece value
-        for move in moves:
-            val_map = [0, 1, 3, 3, 5, 9, 10000]
-
-            pv = val_map[board.at(move.start)]
-            cv = val_map[board.at(move.end)]
-
-            if cv != 0:
-                move.mg = 10 * cv - pv
-        return sorted(moves, key=lambda move: move.mg)
-
-    def alphabeta(board, depth, alpha, beta, white):
-        tb = board.copy()
-        if depth == 0:
-            return board.sevaluate_board()
-        if white:
-            moves = order_moves(tb.calc_color_moves(1), tb)
-            val = float("-inf")
-            for move in moves:
-                tb.move(move)
-                val = max(val, alphabeta(tb, depth - 1, alpha, beta, False))
-                if val > beta:
-                    break
-                alpha = max(alpha, val)
-                tb.take_back()
-            return val
+def order_moves(moves, board, tt_move=None, ordering=None, ply=0):
+    # moves are move codes (see number_board), sorted best first: captures
+    # that don't lose material (by static exchange) in MVV-LVA order, then
+    # killers, then quiet moves by history score, then losing captures
+    # pv : piece value
+    # cv : captured piece value
+    squares = board.squares
+    val_map = PIECE_VALUES
+    killers = ordering.killers_at(ply) if ordering else ()
+    history = ordering.history if ordering else None
+
+    def mg(move):
+        start, end = move & 63, move >> 6 & 63
+        cv = val_map[abs(squares[end >> 3][end & 7])]
+        if cv != 0 or not board.is_quiet(move):
+            see = board.see(move)
+            if see < 0:
+                return (0, see)
+            return (3, 10 * cv - val_map[abs(squares[start >> 3][start & 7])])
+        if move in killers:
+            return (2, 0)
+        return (1, history[move & 4095] if history else 0)
+
+    moves = sorted(moves, key=mg, reverse=True)
+    # the move that was best last time this position was searched goes first
+    if tt_move is not None and tt_move in moves:
+        moves.remove(tt_move)
+        moves.insert(0, tt_move)
+    return moves
+
+
+def mvv_lva(moves, board):
+    # most valuable victim first, least valuable attacker first among equal victims
+    squares = board.squares
+
+    def key(move):
+        start, end = move & 63, move >> 6 & 63
+        victim = PIECE_VALUES[abs(squares[end >> 3][end & 7])]
+        if move >> 14 == PROMOTION_MOVE:
+            victim += PIECE_VALUES[(move >> 12 & 3) + 2] - 1
+        return 10 * victim - PIECE_VALUES[abs(squares[start >> 3][start & 7])]
+
+    return sorted(moves, key=key, reverse=True)
+
+
+def quiescence(board, alpha, beta, color, state):
+    # Only captures and promotions, until the position is quiet, so leaves
+    # aren't scored in the middle of an exchange
+    state.count_qnode()
+    stand_pat = color * board.evaluate_board()
+    if stand_pat >= beta:
+        return stand_pat  # not taking anything is already good enough
+    if stand_pat > alpha:
+        alpha = stand_pat
+    best = stand_pat
+
+    squares = board.squares
+    captures = board.generate(color, state.buffer(len(board.move_list)), True)
+    for move in mvv_lva(captures, board):
+        # delta pruning
+        end = move >> 6 & 63
+        gain = PIECE_VALUES[abs(squares[end >> 3][end & 7])]
+        if move >> 14 == PROMOTION_MOVE:
+            gain += PIECE_VALUES[(move >> 12 & 3) + 2] - 1
+        elif gain == 0:
+            gain = 1  # en passant
+        if stand_pat + gain + DELTA_MARGIN <= alpha:
+            continue
+        # captures that lose material in the exchange aren't worth looking at
+        if SEARCH_SEE and board.see(move) < 0:
+            continue
+
+        board.make(move)
+        score = -quiescence(board, -beta, -alpha, -color, state)
+        board.take_back()
+        if score > best:
+            best = score
+        if score >= beta:
+            break
+        if score > alpha:
+            alpha = score
+    return best
+
+
+def alphabeta(board, depth, alpha, beta, color, state):
+    # negamax, the score is from the point of view of color (1 white, -1 black).
+    # Nodes searched with a window wider than WINDOW are PV nodes: they leave
+    # their best line in state.pv[ply] when the score lands inside the window
+    ply = len(board.move_list)
+    state.pv[ply] = ()
+    if ply and board.is_repetition():
+        # a position seen before is scored as a draw: if it was good for
+        # someone it would only be repeated again
+        return 0
+    if depth == 0:
+        return quiescence(board, alpha, beta, color, state)
+    state.count_node()
+    pv_node = beta - alpha > WINDOW
+
+    tt = state.tt
+    alpha_orig = alpha
+    tt_move = None
+    entry = tt.probe(board.zobrist)
+    if entry:
+        tt_depth, tt_score, tt_flag, tt_move = entry
+        # not on PV nodes, a cutoff there would cut the line short
+        if tt_depth >= depth and not pv_node:
+            if tt_flag == EXACT:
+                return tt_score
+            if tt_flag == LOWER:
+                alpha = max(alpha, tt_score)
+            elif tt_flag == UPPER:
+                beta = min(beta, tt_score)
+            if alpha >= beta:
+                return tt_score
+
+    in_check = board.in_check(color)
+    if (
+        SEARCH_NULL_MOVE
+        and depth >= NULL_MOVE_MIN_DEPTH
+        and not in_check
+        and not pv_node
+        and board.non_pawn[color]  # with only pawns a pass may really be best
+        and not board.last_move_null()
+        and color * board.evaluate_board() >= beta
+    ):
+        # if passing still fails high, a real move would too
+        board.make_null()
+        score = -alphabeta(board, depth - 1 - NULL_MOVE_R, -beta, -beta + WINDOW, -color, state)
+        board.take_back_null()
+        if score >= beta:
+            return beta if score == float("inf") else score  # no mates from a pass
+
+    # make/unmake on the one board, every move is taken back before the next
+    # one (or a cutoff), a timeout is unwound by iterative_deepening.
+    # Moves come from the staged picker, so on a cutoff the rest of the moves
+    # are never generated.
+    ordering = state.ordering
+    killers = ordering.killers_at(ply) if ordering else ()
+    if ordering:
+        moves = board.pick_moves(color, tt_move, killers, ordering.history)
+    else:
+        moves = board.pick_moves(color, tt_move)
+    reduce = SEARCH_LMR and depth >= LMR_MIN_DEPTH and not in_check
+    val = float("-inf")
+    best_move = None
+    for i, move in enumerate(moves):
+        quiet = board.is_quiet(move)
+        board.make(move)
+        if i == 0:
+            score = -alphabeta(board, depth - 1, -beta, -alpha, -color, state)
         else:
-            start = time()
-            moves = order_moves(tb.calc_color_moves(-1), tb)
-            end = time()
-            # print("Time it takes for calculating and ordering moves: "+str(end-start))
-            # sleep(1)
-            val = float("inf")
-            for move in moves:
-                tb.move(move)
-                val = min(val, alphabeta(tb, depth - 1, alpha, beta, True))
-                if val < alpha:
-                    break
-                beta = min(beta, val)
-                tb.take_back()
-            return val
-
-    value = alphabeta(board, depth, float("-inf"), float("inf"), white)
+            # The first move is expected to be the best, the others only have
+            # to be shown worse than it: a late quiet move is first searched
+            # shallower (LMR), then with principal variation search at full
+            # depth with a null window, and only when that fails high inside
+            # the window with the full window
+            research = True
+            if reduce and i >= LMR_MIN_MOVES and quiet and move not in killers and not board.in_check(-color):
+                r = 2 if i >= LMR_DEEP_MOVES and depth > 3 else 1
+                score = -alphabeta(board, depth - 1 - r, -alpha - WINDOW, -alpha, -color, state)
+                research = score > alpha
+            if research and SEARCH_PVS:
+                score = -alphabeta(board, depth - 1, -alpha - WINDOW, -alpha, -color, state)
+                research = alpha < score < beta
+            if research:
+                score = -alphabeta(board, depth - 1, -beta, -alpha, -color, state)
+        board.take_back()
+        if score > val:
+            val = score
+            best_move = move
+            if pv_node and score > alpha:
+                state.pv[ply] = (move,) + state.pv[ply + 1]
+        alpha = max(alpha, val)
+        if alpha >= beta:
+            if ordering and quiet:
+                ordering.cutoff(move, ply, depth)
+            break
+
+    if best_move is None and not in_check and not board.has_legal_move(color):
+        # stalemate, a draw like a repetition (mated stays at -inf)
+        return 0
+    if val <= alpha_orig:
+        flag = UPPER
+    elif val >= beta:
+        flag = LOWER
+    else:
+        flag = EXACT
+    tt.store(board.zobrist, depth, val, flag, best_move)
+    return val
+
+
+# Thanks Sebastian Lague
+def ab(board, depth, white, tt=TT):
+    # value of the position for white, white is whether white is to move
+    color = 1 if white else -1
+    state = SearchState(tt)
+    value = color * alphabeta(board, depth, float("-inf"), float("inf"), color, state)
     return value
 
-def eval_move(state):
-    board, move = state
-    tb = board.copy()
-    tb.move(move)
-    val = ab(tb, 2, True)
-    # print(move)
-    # tb.print()
-    # print(val)
-    # print("---")
-    return (move, val)
-
-def find_best_move(board):
-    nb = NumberBoard(board)
-    assert (nb.move_number % 2 == 1, "Can't play for white")
-    mvs = nb.calc_color_moves(-1)
-    return tbm(
-        board, min(map(eval_move, [(nb, mv) for mv in mvs]), key=lambda x: x[1])[0]
-    )
+def time_budget(movetime=None, clock=None, increment=0):
+    # seconds to spend on this move, None for no limit
+    if movetime is not None:
+        return movetime
+    if clock is not None:
+        # plan for about 30 more moves, but never use up more than half the clock
+        return max(0.05, min(clock / 30 + increment * 0.8, clock / 2))
+    return None
+
+
+def pv_strings(pv):
+    return [str(decode_move(move)) for move in pv]
+
+
+# Worker processes for the parallel root search. The pool is created once and
+# kept between moves (each worker keeps its own transposition table warm);
+# stop_workers() shuts it down when the game is over.
+_pool = None
+_pool_workers = 0
+_shared_alpha = None  # best root score so far this depth, shared by all workers
+_worker_search = None  # in a worker, the search its tables were last used for
+
+
+def _init_worker(shared_alpha):
+    global _shared_alpha
+    _shared_alpha = shared_alpha
+
+
+def start_workers(workers):
+    global _pool, _pool_workers, _shared_alpha
+    if _pool is not None and _pool_workers == workers:
+        return _pool
+    stop_workers()
+    _shared_alpha = Value("d", float("-inf"))
+    _pool = Pool(workers, initializer=_init_worker, initargs=(_shared_alpha,))
+    _pool_workers = workers
+    return _pool
+
+
+def stop_workers():
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.close()
+        _pool.join()
+        _pool = None
+        _pool_workers = 0
+
+
+atexit.register(stop_workers)
+
+
+def _search_root_move(task):
+    # runs in a worker: searches one root move, with alpha taken from the best
+    # score any worker has finished so far, returns
+    # (move, score or None on timeout, pv, nodes, qnodes)
+    global _worker_search
+    nb, move, depth, deadline, search = task
+    if search != _worker_search:
+        # first task of a new move, age the worker's tables like the main ones
+        TT.new_search()
+        ORDERING.new_search()
+        _worker_search = search
+    nb = nb.copy()  # tasks sent in the same chunk arrive sharing one board
+    state = SearchState(TT, deadline)
+    color = nb.side_to_move()
+    nb.make(move)
+    alpha = _shared_alpha.value
+    try:
+        score = -alphabeta(nb, depth - 1, float("-inf"), -alpha, -color, state)
+    except SearchTimeout:
+        return move, None, [], state.nodes, state.qnodes
+    pv = (move,) + state.pv[len(nb.move_list)]
+    with _shared_alpha.get_lock():
+        if score > _shared_alpha.value:
+            _shared_alpha.value = score
+    return move, score, pv, state.nodes, state.qnodes
+
+
+def parallel_search_root(nb, depth, moves, state, pool):
+    # The previous best move is searched first on its own to get a good alpha,
+    # then the others are spread over the workers. Moves that fail low only get
+    # an upper bound, which is still fine for ordering the next depth.
+    # Returns ([(score, move)] best first, pv of the best move).
+    _shared_alpha.value = float("-inf")
+    snapshot = nb.copy()
+    search = (state.tt.generation, nb.zobrist)
+    tasks = [(snapshot, move, depth, state.deadline, search) for move in moves]
+    results = [pool.apply(_search_root_move, (tasks[0],))]
+    results.extend(pool.map(_search_root_move, tasks[1:]))
+    for move, score, pv, nodes, qnodes in results:
+        state.nodes += nodes
+        state.qnodes += qnodes
+    if any(score is None for move, score, pv, nodes, qnodes in results):
+        raise SearchTimeout
+    results.sort(key=lambda r: r[1], reverse=True)
+    return results[0][1], [r[0] for r in results], results[0][2]
+
+
+def search_root(nb, depth, moves, state, alpha=float("-inf"), beta=float("inf")):
+    # One principal variation search over all the root moves in the window
+    # (alpha, beta): the first move gets the whole window, the others a null
+    # window, searched again only when they fail high inside it.
+    # Returns (score, moves with the best first, pv of move codes); a score
+    # at or outside the window is only a bound, and the pv then not exact.
+    # The other moves follow by their scores, for the next depth (a move
+    # that failed low is ordered by its bound, one not searched after a
+    # cutoff goes last), like parallel_search_root orders them.
+    color = nb.side_to_move()
+    ply = len(nb.move_list)
+    alpha_orig = alpha
+    best, best_move, pv = float("-inf"), moves[0], (moves[0],)
+    scores = {}
+    for i, move in enumerate(moves):
+        nb.make(move)
+        if i == 0 or not SEARCH_PVS:
+            score = -alphabeta(nb, depth - 1, -beta, -alpha, -color, state)
+        else:
+            score = -alphabeta(nb, depth - 1, -alpha - WINDOW, -alpha, -color, state)
+            if alpha < score < beta:
+                score = -alphabeta(nb, depth - 1, -beta, -alpha, -color, state)
+        nb.take_back()
+        scores[move] = score
+        if score > best:
+            best, best_move = score, move
+            pv = (move,) + state.pv[ply + 1]
+        alpha = max(alpha, score)
+        if alpha >= beta:
+            break
+    if best <= alpha_orig:
+        flag = UPPER
+    elif best >= beta:
+        flag = LOWER
+    else:
+        flag = EXACT
+    state.tt.store(nb.zobrist, depth, best, flag, best_move)
+    rest = [move for move in moves if move != best_move]
+    rest.sort(key=lambda move: scores.get(move, float("-inf")), reverse=True)
+    return best, [best_move] + rest, pv
+
+
+def aspiration_search(nb, depth, moves, state, guess):
+    # search_root in a window around guess, the score of the depth before,
+    # widened and searched again until the score lands inside it
+    if guess is None or abs(guess) == float("inf") or not SEARCH_ASPIRATION:
+        return search_root(nb, depth, moves, state)
+    low = high = ASPIRATION_WINDOW
+    while True:
+        alpha = guess - low if low <= ASPIRATION_MAX else float("-inf")
+        beta = guess + high if high <= ASPIRATION_MAX else float("inf")
+        score, moves, pv = search_root(nb, depth, moves, state, alpha, beta)
+        if score <= alpha and alpha != float("-inf"):
+            low *= 2
+        elif score >= beta and beta != float("inf"):
+            high *= 2
+        else:
+            return score, moves, pv
+        state.researches += 1
+
+
+def iterative_deepening(
+    nb,
+    budget=None,
+    max_depth=BOT_MAX_DEPTH,
+    on_info=None,
+    tt=TT,
+    workers=1,
+    ordering=ORDERING,
+    moves=None,
+):
+    # Searches 1, 2, 3... plies deep until the budget (seconds) runs out and
+    # returns (best move, score, info) of the last finished depth, the move as
+    # a number_board.Move (the search itself works on move codes).
+    # With more than one worker the root moves are searched in parallel.
+    # moves are the legal move codes here if they are known already.
+    # Each depth is one principal variation search of the root moves, in an
+    # aspiration window around the score of the depth before.
+    # info has one dict per finished depth with depth, score, nodes,
+    # qnodes (quiescence), nps, time, pv (the best line, as move strings) and
+    # researches (root searches repeated after missing the aspiration window,
+    # so far); on_info is called with each one as it is done.
+    start = time()
+    tt.new_search()
+    ordering.new_search()
+    if moves is None:
+        moves = nb.generate(nb.side_to_move(), array("H"))
+    moves = list(moves)
+    if not moves:
+        return None, None, []
+    if budget is None and max_depth == BOT_MAX_DEPTH:
+        max_depth = 3  # no time control, search as deep as the old fixed depth
+    ply = len(nb.move_list)
+    best, score, infos = moves[0], None, []
+    state = SearchState(tt, None, ordering)
+    moves = order_moves(moves, nb, tt.best_move(nb.zobrist), state.ordering, len(nb.move_list))
+    pool = start_workers(workers) if workers > 1 else None
+    for depth in range(1, max_depth + 1):
+        # the first depth always finishes, so there is always a move to play
+        state.deadline = start + budget if budget is not None and depth > 1 else None
+        try:
+            if pool:
+                result = parallel_search_root(nb, depth, moves, state, pool)
+            else:
+                result = aspiration_search(nb, depth, moves, state, score)
+        except SearchTimeout:
+            while len(nb.move_list) > ply:
+                nb.take_back()
+            break
+        score, moves, pv = result
+        best = moves[0]
+        elapsed = time() - start
+        info = {
+            "depth": depth,
+            "score": score,
+            "nodes": state.nodes,
+            "qnodes": state.qnodes,
+            "nps": round((state.nodes + state.qnodes) / elapsed) if elapsed > 0 else None,
+            "time": round(elapsed, 3),
+            "pv": pv_strings(pv),
+            "researches": state.researches,
+        }
+        infos.append(info)
+        if on_info:
+            on_info(info)
+        if abs(score) == float("inf") or len(moves) == 1:
+            break  # mate found or only one move, deeper won't change anything
+        if budget is not None and time() - start > budget / 2:
+            break  # the next depth would not finish in time anyway
+    return decode_move(best), score, infos
+
+
+def find_best_move(
+    board,
+    backend=None,
+    movetime=None,
+    clock=None,
+    increment=0,
+    on_info=None,
+    workers=BOT_WORKERS,
+):
+    # movetime or clock/increment are in seconds, without either the bot
+    # searches to a fixed depth. None when the side to move has no legal move
+    # the board's own NumberBoard mirror, copied so the search can't disturb
+    # it, and its root moves from the cache the GUI has filled already
+    nb = board.nb.copy() if backend is None else new_board(board, backend)
+    moves = MOVE_CACHE.get(nb, nb.side_to_move()).codes
+    budget = time_budget(movetime, clock, increment)
+    move, score, infos = iterative_deepening(nb, budget, on_info=on_info, workers=workers, moves=moves)
+    if move is None:
+        return None
+    return tbm(board, move)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# Perft suite: checks move generation against known node counts and measures
+# its speed. Run from src/, e.g.
+#   python perft.py --depth 3
+#   python perft.py --backend bitboard --depth 4 --json perft.json
+#   python perft.py --position kiwipete --divide 2
+import argparse
+import json
+import platform
+from time import time
+
+from backend import BACKENDS, new_board
+from const import BACKEND
+
+# (name, FEN, {depth: reference node count})
+POSITIONS = [
+    (
+        "startpos",
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+        {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609},
+    ),
+    (
+        "kiwipete",
+        "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        {1: 48, 2: 2039, 3: 97862, 4: 4085603},
+    ),
+    (
+        "pins-and-en-passant",
+        "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624},
+    ),
+    (
+        "promotions-and-castling",
+        "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        {1: 6, 2: 264, 3: 9467, 4: 422333},
+    ),
+    (
+        "promotion-with-capture",
+        "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        {1: 44, 2: 1486, 3: 62379, 4: 2103487},
+    ),
+    (
+        "middlegame",
+        "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+        {1: 46, 2: 2079, 3: 89890, 4: 3894594},
+    ),
+    (
+        "illegal-en-passant",
+        "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1",
+        {1: 18, 2: 92, 3: 1670, 4: 10138, 5: 185429, 6: 1134888},
+    ),
+    (
+        "en-passant-gives-check",
+        "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1",
+        {1: 15, 2: 126, 3: 1928, 4: 13931, 5: 206379, 6: 1440467},
+    ),
+    (
+        "short-castle-gives-check",
+        "5k2/8/8/8/8/8/8/4K2R w K - 0 1",
+        {1: 15, 2: 66, 3: 1198, 4: 6399, 5: 120330, 6: 661072},
+    ),
+    (
+        "long-castle-gives-check",
+        "3k4/8/8/8/8/8/8/R3K3 w Q - 0 1",
+        {1: 16, 2: 71, 3: 1286, 4: 7418, 5: 141077, 6: 803711},
+    ),
+    (
+        "castling-prevented",
+        "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1",
+        {1: 44, 2: 1494, 3: 50509, 4: 1720476},
+    ),
+    (
+        "promote-out-of-check",
+        "2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1",
+        {1: 11, 2: 133, 3: 1442, 4: 19174, 5: 266199, 6: 3821001},
+    ),
+    (
+        "discovered-check",
+        "8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1",
+        {1: 29, 2: 165, 3: 5160, 4: 31961, 5: 1004658},
+    ),
+    (
+        "promote-to-give-check",
+        "4k3/1P6/8/8/8/8/K7/8 w - - 0 1",
+        {1: 9, 2: 40, 3: 472, 4: 2661, 5: 38983, 6: 217342},
+    ),
+    (
+        "underpromote-to-check",
+        "8/P1k5/K7/8/8/8/8/8 w - - 0 1",
+        {1: 6, 2: 27, 3: 273, 4: 1329, 5: 18135, 6: 92683},
+    ),
+    (
+        "self-stalemate",
+        "K1k5/8/P7/8/8/8/8/8 w - - 0 1",
+        {1: 2, 2: 6, 3: 13, 4: 63, 5: 382, 6: 2217},
+    ),
+    (
+        "stalemate-and-checkmate",
+        "8/k1P5/8/1K6/8/8/8/8 w - - 0 1",
+        {1: 10, 2: 25, 3: 268, 4: 926, 5: 10857, 6: 43261, 7: 567584},
+    ),
+]
+
+
+def run_position(name, fen, counts, depth, backend):
+    # runs every reference depth up to depth, returns one result per depth
+    results = []
+    for d in sorted(counts):
+        if d > depth:
+            break
+        nb = new_board(backend=backend).from_fen(fen)
+        start = time()
+        nodes = nb.perft(d)
+        elapsed = time() - start
+        results.append(
+            {
+                "position": name,
+                "fen": fen,
+                "depth": d,
+                "expected": counts[d],
+                "nodes": nodes,
+                "passed": nodes == counts[d],
+                "seconds": round(elapsed, 4),
+                "nps": round(nodes / elapsed) if elapsed > 0 else None,
+            }
+        )
+    return results
+
+
+def run_suite(depth, backend, names=None):
+    results = []
+    for name, fen, counts in POSITIONS:
+        if names and name not in names:
+            continue
+        for r in run_position(name, fen, counts, depth, backend):
+            print(
+                "{:<5} {:<26} depth {} nodes {:>9} expected {:>9} {:>8.3f}s {:>9} nps".format(
+                    "ok" if r["passed"] else "FAIL",
+                    r["position"],
+                    r["depth"],
+                    r["nodes"],
+                    r["expected"],
+                    r["seconds"],
+                    r["nps"] or "-",
+                )
+            )
+            results.append(r)
+    return results
+
+
+def summarize(results, backend, depth):
+    nodes = sum(r["nodes"] for r in results)
+    seconds = sum(r["seconds"] for r in results)
+    return {
+        "backend": backend,
+        "max_depth": depth,
+        "python": platform.python_version(),
+        "time": time(),
+        "passed": all(r["passed"] for r in results),
+        "nodes": nodes,
+        "seconds": round(seconds, 4),
+        "nps": round(nodes / seconds) if seconds > 0 else None,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft correctness and speed suite")
+    parser.add_argument("--depth", type=int, default=3, help="deepest reference count to run")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=None)
+    parser.add_argument("--position", action="append", help="only run these positions (by name)")
+    parser.add_argument("--divide", type=int, metavar="DEPTH", help="print perft divide for the positions")
+    parser.add_argument("--json", metavar="PATH", help="write the results as JSON")
+    args = parser.parse_args()
+
+    if args.divide:
+        for name, fen, counts in POSITIONS:
+            if args.position and name not in args.position:
+                continue
+            nb = new_board(backend=args.backend).from_fen(fen)
+            counts = nb.divide(args.divide)
+            print(name)
+            for move, nodes in sorted(counts.items()):
+                print("  {} {}".format(move, nodes))
+            print("  total {}".format(sum(counts.values())))
+        return 0
+
+    results = run_suite(args.depth, args.backend, args.position)
+    summary = summarize(results, args.backend or BACKEND, args.depth)
+    print(
+        "{} nodes in {:.3f}s, {} nps, {}".format(
+            summary["nodes"],
+            summary["seconds"],
+            summary["nps"],
+            "all passed" if summary["passed"] else "FAILURES",
+        )
+    )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 0 if summary["passed"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
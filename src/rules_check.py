@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# Game rules check: plays random games with take-backs and null moves on
+# each backend and checks the state NumberBoard keeps move by move for the
+# draw rules against a recount from the game so far, and the game over
+# answers Game.check_game_over uses (LegalMoves.status, draw_status) against
+# a full generation and board scan. Run from src/, e.g.
+#   python rules_check.py
+#   python rules_check.py --backend number --games 200
+import argparse
+import random
+from array import array
+from collections import Counter
+
+from backend import BACKENDS, new_board
+from move_cache import MoveCache
+from number_board import Move, NumberBoard, color
+
+START = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+def insufficient_material_scan(nb):
+    # draw_by_insufficient_material the slow way, looking at every square: no
+    # pawns, and a lone king against bishops all on one square color (or
+    # nothing), or at most four pieces with each side holding a knight or a
+    # bishop, two knights, or nothing
+    pieces = {1: [], -1: []}  # each side's pieces but the king
+    for row in range(8):
+        for col in range(8):
+            p = nb.squares[row][col]
+            if p == 1 or p == -1:
+                return False
+            if p and abs(p) != 6:
+                pieces[color(p)].append((abs(p), (row + col) % 2 if abs(p) == 3 else None))
+
+    def one_color_bishops(side):
+        return all(kind == 3 for kind, sq in pieces[side]) and len({sq for kind, sq in pieces[side]}) <= 1
+
+    def side_insufficient(side):
+        ps = pieces[side]
+        if len(ps) == 2:
+            return all(kind == 2 for kind, sq in ps) or one_color_bishops(side)
+        return len(ps) == 0 or ps[0][0] in (2, 3)
+
+    for side in 1, -1:
+        if not pieces[-side] and one_color_bishops(side):
+            return True
+    if len(pieces[1]) + len(pieces[-1]) > 2:
+        return False
+    return side_insufficient(1) and side_insufficient(-1)
+
+
+def material_check(sets, rng):
+    # random pawnless material (now and then a pawn or a major piece) on an
+    # empty board: the signature lookup against the scan
+    mismatches = 0
+    for _ in range(sets):
+        nb = NumberBoard()
+        squares = rng.sample(range(64), 2 + rng.randint(0, 4))
+        kinds = [1, 4, 5, 2, 3, 3] if rng.random() < 0.2 else [2, 3]
+        pieces = [6, -6] + [rng.choice(kinds) * rng.choice([1, -1]) for _ in squares[2:]]
+        for s, p in zip(squares, pieces):
+            nb.squares[s >> 3][s & 7] = p
+        nb.refresh()
+        if nb.draw_by_insufficient_material() != insufficient_material_scan(nb):
+            mismatches += 1
+    return mismatches
+
+
+def expected_status(nb, halfmove, repeated):
+    # what Game.check_game_over should find, from a full generation, the
+    # recounted clock and repetitions and the board scan
+    pcolor = nb.side_to_move()
+    if not nb.generate(pcolor, array("H")):
+        return "checkmate" if nb.in_check(pcolor) else "stalemate"
+    if halfmove >= 100:
+        return "fifty moves"
+    if repeated >= 3:
+        return "repetition"
+    if insufficient_material_scan(nb):
+        return "insufficient material"
+    return None
+
+
+def shuffle_check(backend):
+    # both knights out and back twice: the start position for the third time
+    nb = new_board(backend=backend).from_fen(START)
+    seen = []
+    for _ in range(2):
+        for move in ["g1->f3", "g8->f6", "f3->g1", "f6->g8"]:
+            seen.append(nb.threefold_repetition())
+            nb.move(Move.from_string(move))
+    return nb.threefold_repetition() and not any(seen)
+
+
+def play(backend, games, plies, rng):
+    # (positions checked, what didn't match the recount)
+    checked = 0
+    errors = Counter()
+    cache = MoveCache()
+    for game in range(games):
+        nb = new_board(backend=backend).from_fen(START)
+        keys = [nb.zobrist]  # the key after every move played
+        irreversible = [0]  # index into keys of the last capture or pawn move
+        clocks = [0]  # the halfmove clock after every move played
+        for ply in range(plies):
+            codes = nb.generate(nb.side_to_move(), array("H"))
+            if not codes:
+                break
+            if nb.move_list and rng.random() < 0.2:
+                nb.take_back()
+                keys.pop()
+                irreversible.pop()
+                clocks.pop()
+            else:
+                nb.make(rng.choice(codes))
+                keys.append(nb.zobrist)
+                lm = nb.move_list[-1]
+                reset = lm.taking or lm.moving == lm.color
+                irreversible.append(len(keys) - 1 if reset else irreversible[-1])
+                clocks.append(0 if reset else clocks[-1] + 1)
+            if rng.random() < 0.1:
+                nb.make_null()
+                nb.take_back_null()
+            checked += 1
+            counts = Counter(keys[irreversible[-1] :])
+            if nb.repetitions != dict(counts):
+                errors["repetitions"] += 1
+            if nb.is_repetition() != (counts[nb.zobrist] > 1):
+                errors["is_repetition"] += 1
+            if nb.threefold_repetition() != (counts[nb.zobrist] >= 3):
+                errors["threefold_repetition"] += 1
+            copy = nb.copy()
+            if copy.repetitions != nb.repetitions or copy.repetitions is nb.repetitions:
+                errors["copy"] += 1
+            if nb.halfmove != clocks[-1]:
+                errors["halfmove"] += 1
+            if nb.signature != nb.compute_signature():
+                errors["signature"] += 1
+            pcolor = nb.side_to_move()
+            if nb.has_legal_move(pcolor) != bool(nb.generate(pcolor, array("H"))):
+                errors["has_legal_move"] += 1
+            # the way Game.check_game_over asks
+            status = cache.get(nb, pcolor).status()
+            if status not in ("checkmate", "stalemate"):
+                status = nb.draw_status()
+            if status != expected_status(nb, clocks[-1], counts[nb.zobrist]):
+                errors["game over"] += 1
+    return checked, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Draw rule state and game over check")
+    parser.add_argument("--backend", action="append", choices=sorted(BACKENDS), help="backends to check (default all)")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--plies", type=int, default=120)
+    parser.add_argument("--material", type=int, default=30000, help="random material sets for the insufficient material check")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    mismatches = material_check(args.material, random.Random(args.seed))
+    print("material  {} sets, {} mismatches".format(args.material, mismatches))
+    failed = mismatches > 0
+    for backend in args.backend or sorted(BACKENDS):
+        checked, errors = play(backend, args.games, args.plies, random.Random(args.seed))
+        if not shuffle_check(backend):
+            errors["knight shuffle"] += 1
+        print("{:<9} {} positions, {} mismatches {}".format(backend, checked, sum(errors.values()), dict(errors) or ""))
+        failed = failed or bool(errors)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
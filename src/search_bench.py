@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# Search benchmark: searches a few positions to a fixed depth (or for a fixed
+# time, reporting the depth reached) and reports time, nodes and nodes/sec.
+# Run from src/, e.g.
+#   python search_bench.py --depth 4
+#   python search_bench.py --depth 4 --workers 1,2,4,8,16 --json scaling.json
+#   python search_bench.py --depth 4 --compare history
+#   python search_bench.py --movetime 2 --compare null
+import argparse
+import json
+import os
+import platform
+from time import time
+
+import other_bot
+from backend import BACKENDS, new_board
+from const import BACKEND
+
+# (name, FEN)
+POSITIONS = [
+    ("startpos", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"),
+    ("italian", "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 5 4"),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"),
+    ("middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10"),
+    ("endgame", "8/5pk1/6p1/3P4/1p3P2/1P4P1/5K2/8 w - - 0 40"),
+]
+
+# search features that can be switched off, name -> other_bot flag
+FEATURES = {
+    "history": "SEARCH_HISTORY",
+    "null": "SEARCH_NULL_MOVE",
+    "lmr": "SEARCH_LMR",
+    "pvs": "SEARCH_PVS",
+    "aspiration": "SEARCH_ASPIRATION",
+    "see": "SEARCH_SEE",
+}
+
+
+def set_features(off):
+    for name, flag in FEATURES.items():
+        setattr(other_bot, flag, name not in off)
+
+
+def bench(depth, backend, workers, names=None, movetime=None):
+    # searches every position to depth (or for movetime seconds, as deep as it
+    # gets) from an empty table, one result each
+    results = []
+    other_bot.stop_workers()  # fresh worker tables too
+    for name, fen in POSITIONS:
+        if names and name not in names:
+            continue
+        other_bot.TT.clear()
+        other_bot.ORDERING.clear()
+        nb = new_board(backend=backend).from_fen(fen)
+        start = time()
+        if movetime is None:
+            move, score, infos = other_bot.iterative_deepening(
+                nb, None, max_depth=depth, workers=workers
+            )
+        else:
+            move, score, infos = other_bot.iterative_deepening(nb, movetime, workers=workers)
+        elapsed = time() - start
+        nodes = infos[-1]["nodes"] + infos[-1]["qnodes"]
+        results.append(
+            {
+                "position": name,
+                "depth": infos[-1]["depth"],
+                "move": str(move),
+                "score": score,
+                "nodes": nodes,
+                "seconds": round(elapsed, 4),
+                "nps": round(nodes / elapsed) if elapsed > 0 else None,
+            }
+        )
+        print(
+            "{:<12} workers {:>2} depth {} {:<8} score {:>8.2f} nodes {:>9} {:>8.3f}s {:>8} nps".format(
+                name,
+                workers,
+                results[-1]["depth"],
+                results[-1]["move"],
+                score,
+                nodes,
+                elapsed,
+                results[-1]["nps"],
+            )
+        )
+    other_bot.stop_workers()
+    return results
+
+
+def compare(args):
+    # fixed depth node counts with the feature off and on, or with --movetime
+    # the depth each reaches in the same time
+    workers = int(args.workers.split(",")[0])
+    set_features(args.without + [args.compare])
+    off = bench(args.depth, args.backend, workers, args.position, args.movetime)
+    set_features(args.without)
+    on = bench(args.depth, args.backend, workers, args.position, args.movetime)
+    set_features([])
+    rows = []
+    if args.movetime is not None:
+        print("{:<12} {:>10} {:>10}".format("position", args.compare + " off", "on"))
+        for a, b in zip(off, on):
+            rows.append({"position": a["position"], "off": a, "on": b, "gain": b["depth"] - a["depth"]})
+            print("{:<12} {:>10} {:>10}".format(a["position"], "depth %d" % a["depth"], "depth %d" % b["depth"]))
+    else:
+        print("{:<12} {:>10} {:>10} {:>10}".format("position", args.compare + " off", "on", "reduction"))
+        for a, b in zip(off, on):
+            reduction = 1 - b["nodes"] / a["nodes"] if a["nodes"] else 0
+            rows.append({"position": a["position"], "off": a, "on": b, "reduction": round(reduction, 4)})
+            print("{:<12} {:>10} {:>10} {:>9.1f}%".format(a["position"], a["nodes"], b["nodes"], 100 * reduction))
+        total_off = sum(a["nodes"] for a in off)
+        total_on = sum(b["nodes"] for b in on)
+        print("{:<12} {:>10} {:>10} {:>9.1f}%".format("total", total_off, total_on, 100 * (1 - total_on / total_off)))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "feature": args.compare,
+                    "without": args.without,
+                    "backend": args.backend or BACKEND,
+                    "depth": args.depth,
+                    "movetime": args.movetime,
+                    "python": platform.python_version(),
+                    "time": time(),
+                    "positions": rows,
+                },
+                f,
+                indent=2,
+            )
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fixed depth search benchmark")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--movetime", type=float, help="search each position for this many seconds instead, reporting the depth reached")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=None)
+    parser.add_argument("--workers", default="1", help="comma separated worker counts to compare, e.g. 1,2,4,8")
+    parser.add_argument("--position", action="append", help="only run these positions (by name)")
+    parser.add_argument("--without", action="append", default=[], choices=sorted(FEATURES), help="search with this feature off")
+    parser.add_argument("--compare", choices=sorted(FEATURES), help="report the nodes a feature saves, searching with it off and on")
+    parser.add_argument("--json", metavar="PATH", help="write the results as JSON")
+    args = parser.parse_args()
+
+    if args.compare:
+        return compare(args)
+
+    set_features(args.without)
+    runs = []
+    for workers in [int(w) for w in args.workers.split(",")]:
+        results = bench(args.depth, args.backend, workers, args.position, args.movetime)
+        seconds = sum(r["seconds"] for r in results)
+        runs.append({"workers": workers, "seconds": round(seconds, 4), "results": results})
+
+    base = runs[0]["seconds"]
+    print("workers  seconds  speedup")
+    for run in runs:
+        run["speedup"] = round(base / run["seconds"], 2) if run["seconds"] > 0 else None
+        print("{:>7} {:>8.3f} {:>8}".format(run["workers"], run["seconds"], run["speedup"]))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "backend": args.backend or BACKEND,
+                    "depth": args.depth,
+                    "movetime": args.movetime,
+                    "cpus": os.cpu_count(),
+                    "python": platform.python_version(),
+                    "time": time(),
+                    "runs": runs,
+                },
+                f,
+                indent=2,
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# Static exchange check: compares NumberBoard.see with playing the exchange
+# out on the board, every capture and quiet move over the eval_bench corpus.
+# The reference takes on the end square with the cheapest pseudo legal
+# capture each time (pins ignored, like see) and lets each side stop when
+# taking again doesn't pay. Run from src/, e.g.
+#   python see_check.py
+#   python see_check.py --games 50
+import argparse
+from array import array
+
+from eval_bench import corpus
+from number_board import SEE_VALUES, PROMOTION_MOVE, EN_PASSANT_MOVE, CASTLE_MOVE, decode_move
+
+
+def captures_on(nb, e):
+    # the pseudo legal captures onto square index e by the side to move; the
+    # king only where it isn't taken back
+    pcolor = nb.side_to_move()
+    buf = array("H")
+    for s in range(64):
+        if nb.squares[s >> 3][s & 7] * pcolor > 0:
+            nb._pseudo_codes(s, pcolor, buf, True)
+    codes = []
+    for code in buf:
+        if code >> 6 & 63 != e or code >> 14 == EN_PASSANT_MOVE:
+            continue
+        s = code & 63
+        if abs(nb.squares[s >> 3][s & 7]) == 6:
+            nb.make(code)
+            attacked = nb.in_check(pcolor)
+            nb.take_back()
+            if attacked:
+                continue
+        codes.append(code)
+    return codes
+
+
+def exchange(nb, e):
+    # what the side to move wins by taking on e, or 0 if it had better not
+    codes = captures_on(nb, e)
+    if not codes:
+        return 0
+    values = SEE_VALUES
+    # cheapest piece first, a pawn promoting to a queen
+    code = min(codes, key=lambda c: (values[nb.squares[(c & 63) >> 3][c & 7]], -(c >> 12 & 3)))
+    gain = values[nb.squares[e >> 3][e & 7]]
+    if code >> 14 == PROMOTION_MOVE:
+        gain += values[(code >> 12 & 3) + 2] - values[1]
+    nb.make(code)
+    gain -= exchange(nb, e)
+    nb.take_back()
+    return max(0, gain)
+
+
+def reference_see(nb, code):
+    # see() played out: the move, then the exchange on its end square
+    e = code >> 6 & 63
+    values = SEE_VALUES
+    gain = values[nb.squares[e >> 3][e & 7]]
+    if code >> 14 == EN_PASSANT_MOVE:
+        gain = values[1]
+    elif code >> 14 == PROMOTION_MOVE:
+        gain += values[(code >> 12 & 3) + 2] - values[1]
+    nb.make(code)
+    gain -= exchange(nb, e)
+    nb.take_back()
+    return gain
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Static exchange evaluation check")
+    parser.add_argument("--games", type=int, default=20, help="random games added to the corpus")
+    args = parser.parse_args()
+
+    moves = 0
+    mismatches = 0
+    for nb in corpus(args.games):
+        for code in nb.generate(nb.side_to_move(), array("H")):
+            if code >> 14 == CASTLE_MOVE:
+                continue
+            moves += 1
+            see, expected = nb.see(code), reference_see(nb, code)
+            if see != expected:
+                mismatches += 1
+                if mismatches <= 10:
+                    nb.print()
+                    print("{}: see {} exchange {}".format(decode_move(code), see, expected))
+    print("{} moves, {} mismatches".format(moves, mismatches))
+    return 0 if mismatches == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,92 @@
+from const import *
+
+# Bound types for a stored score
+EXACT = 0
+LOWER = 1  # the search failed high, score is at least this
+UPPER = 2  # the search failed low, score is at most this
+
+# Rough size of one stored entry (the tuple, its key and score objects and
+# the list slot pointing at it), used to turn a budget in MB into a slot count
+ENTRY_BYTES = 160
+
+
+class TranspositionTable:
+    # Fixed size hash table of search results keyed by NumberBoard.zobrist.
+    # Each bucket has two slots: a depth-preferred slot that is only replaced by
+    # a deeper search (or an entry left over from an earlier search), and an
+    # always-replace slot that takes everything else.
+    # Entries are (key, depth, score, flag, move, generation) tuples.
+    def __init__(self, size_mb=TT_SIZE_MB):
+        self.size_mb = size_mb
+        buckets = max(1, int(size_mb * 2**20) // (2 * ENTRY_BYTES))
+        buckets = 1 << (buckets.bit_length() - 1)  # power of two, so we can mask
+        self.mask = buckets - 1
+        self.deep = [None] * buckets
+        self.recent = [None] * buckets
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def new_search(self):
+        # entries from earlier searches may be replaced regardless of depth
+        self.generation += 1
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def clear(self):
+        self.deep = [None] * len(self.deep)
+        self.recent = [None] * len(self.recent)
+        self.new_search()
+
+    def probe(self, key):
+        # returns (depth, score, flag, move) or None
+        self.probes += 1
+        i = key & self.mask
+        entry = self.deep[i]
+        if entry is None or entry[0] != key:
+            entry = self.recent[i]
+            if entry is None or entry[0] != key:
+                return None
+        self.hits += 1
+        return entry[1:5]
+
+    def best_move(self, key):
+        # the stored move for key without counting it as a probe, for reading the PV
+        i = key & self.mask
+        for entry in (self.deep[i], self.recent[i]):
+            if entry is not None and entry[0] == key:
+                return entry[4]
+        return None
+
+    def store(self, key, depth, score, flag, move):
+        self.stores += 1
+        i = key & self.mask
+        entry = (key, depth, score, flag, move, self.generation)
+        deep = self.deep[i]
+        if deep is None or depth >= deep[1] or deep[5] != self.generation:
+            if deep is not None and deep[0] != key:
+                self.recent[i] = deep  # keep the entry we push out around a bit longer
+            self.deep[i] = entry
+        else:
+            self.recent[i] = entry
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def fill(self):
+        # fraction of depth-preferred slots in use, to see if the table is too small
+        sample = self.deep[:1000]
+        return sum(1 for e in sample if e is not None) / len(sample)
+
+    def stats(self):
+        return {
+            "size_mb": self.size_mb,
+            "buckets": len(self.deep),
+            "probes": self.probes,
+            "hits": self.hits,
+            "hit_rate": round(self.hit_rate(), 4),
+            "stores": self.stores,
+            "fill": round(self.fill(), 4),
+        }